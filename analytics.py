@@ -0,0 +1,170 @@
+"""
+This module produces customer and invoice analytics from the history
+of past orders, such as monthly volumes per customer, the top customers,
+invoice sizes and which customers received each gyle.
+"""
+import heapq
+from datetime import datetime
+import prediction
+
+_index = {'fingerprint': None, 'data': None}
+
+
+def build_index(orders: list) -> dict:
+    """
+    Groups the past orders by customer, invoice and gyle in a single pass
+
+    The returned dictionary contains:
+    customer_months - the bottles ordered by each customer in each month
+    customer_totals - the total bottles ordered by each customer
+    customer_gyles - the bottles of each gyle sent to each customer
+    invoices - the customer, date, bottles and order lines of each invoice
+    gyles - the recipe of each gyle and the bottles sent to each customer
+
+    Arguments:
+    orders - list of dictionaries containing the past orders
+    """
+    months = {}  # each distinct date is only parsed once
+    customer_months = {}
+    customer_totals = {}
+    customer_gyles = {}
+    invoices = {}
+    gyles = {}
+    for order in orders:
+        date = order['Date Required']
+        if date not in months:
+            months[date] = datetime.strptime(date, '%d-%b-%y').strftime(
+                '%Y-%m')
+        month = months[date]
+        customer = order['Customer']
+        invoice = order['Invoice Number']
+        gyle = order['Gyle Number']
+        quantity = int(order['Quantity ordered'])
+
+        volumes = customer_months.setdefault(customer, {})
+        volumes[month] = volumes.get(month, 0) + quantity
+        customer_totals[customer] = customer_totals.get(customer, 0) + quantity
+        sent = customer_gyles.setdefault(customer, {})
+        sent[gyle] = sent.get(gyle, 0) + quantity
+
+        if invoice not in invoices:  # first line of the invoice
+            invoices[invoice] = {
+                'customer': customer,
+                'date': date,
+                'quantity': 0,
+                'lines': 0}
+        invoices[invoice]['quantity'] += quantity
+        invoices[invoice]['lines'] += 1
+
+        if gyle not in gyles:  # first order from the gyle
+            gyles[gyle] = {'recipe': order['Recipe'], 'customers': {}}
+        received = gyles[gyle]['customers']
+        received[customer] = received.get(customer, 0) + quantity
+    return {
+        'customer_months': customer_months,
+        'customer_totals': customer_totals,
+        'customer_gyles': customer_gyles,
+        'invoices': invoices,
+        'gyles': gyles}
+
+
+def get_index() -> dict:
+    """
+    Returns the grouped order index, rebuilding it if the sales data changed
+    """
+    fingerprint = prediction.dataset_fingerprint()
+    if _index['fingerprint'] != fingerprint:
+        _index['data'] = build_index(prediction.csv_read())
+        _index['fingerprint'] = fingerprint
+    return _index['data']
+
+
+def customer_monthly_volumes(customer: str) -> dict:
+    """
+    Returns the number of bottles a customer ordered in each month
+
+    Arguments:
+    customer - the name of the customer
+    """
+    volumes = get_index()['customer_months'].get(customer, {})
+    return dict(sorted(volumes.items()))
+
+
+def top_customers(count: int = 10, month: str = "") -> list:
+    """
+    Returns the customers who ordered the most bottles, largest first
+
+    Arguments:
+    count - the number of customers to return
+    month - only count the orders from this month, e.g. '2019-06' (optional)
+    """
+    index = get_index()
+    if month:
+        totals = {}
+        for customer, volumes in index['customer_months'].items():
+            if month in volumes:
+                totals[customer] = volumes[month]
+    else:
+        totals = index['customer_totals']
+    return heapq.nlargest(count, totals.items(), key=lambda item: item[1])
+
+
+def invoice_sizes(customer: str = "") -> dict:
+    """
+    Returns the total number of bottles on each invoice
+
+    Arguments:
+    customer - only return the invoices of this customer (optional)
+    """
+    sizes = {}
+    for invoice, info in get_index()['invoices'].items():
+        if not customer or info['customer'] == customer:
+            sizes[invoice] = info['quantity']
+    return sizes
+
+
+def invoice_summary() -> dict:
+    """Returns the number, mean, median, smallest and largest invoice size"""
+    sizes = sorted(invoice_sizes().values())
+    if not sizes:
+        return {'count': 0, 'mean': 0, 'median': 0, 'min': 0, 'max': 0}
+    middle = len(sizes) // 2
+    if len(sizes) % 2:
+        median = sizes[middle]
+    else:
+        median = (sizes[middle - 1] + sizes[middle]) / 2
+    return {
+        'count': len(sizes),
+        'mean': float("%.1f" % (sum(sizes) / len(sizes))),
+        'median': median,
+        'min': sizes[0],
+        'max': sizes[-1]}
+
+
+def gyle_customers(gyle: int) -> dict:
+    """
+    Returns the customers who received bottles from a gyle
+
+    Arguments:
+    gyle - the gyle number of the batch
+    """
+    info = get_index()['gyles'].get(str(gyle))
+    if not info:
+        return {}
+    return dict(info['customers'])
+
+
+def customer_gyles(customer: str) -> dict:
+    """
+    Returns the gyles a customer received bottles from
+
+    Arguments:
+    customer - the name of the customer
+    """
+    return dict(get_index()['customer_gyles'].get(customer, {}))
+
+
+if __name__ == "__main__":
+    for customer, bottles in top_customers():
+        print("%s: %d bottles" % (customer, bottles))
+    print(invoice_summary())
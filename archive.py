@@ -0,0 +1,177 @@
+"""
+This module moves finished batches out of the state file into an archive.
+
+Bottled batches whose bottles have all been ordered are appended to a
+compressed JSON Lines file and removed from the inventory, so the state
+file only holds the batches which are still in use. The bottles and
+number of archived batches of each beer, and the highest archived gyle
+number, are kept in the state file so the inventory totals and new gyle
+numbers do not need the archive. Run it from the command line, e.g.
+    python archive.py run
+    python archive.py list --recipe "Organic Dunkel"
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Iterator
+import analytics
+import brewery
+
+ARCHIVE_FILE = 'inventory_archive.jsonl.gz'
+
+
+def sold_bottles() -> dict:
+    """Returns the number of bottles ordered from each gyle"""
+    sold = {}
+    for gyle, info in analytics.get_index()['gyles'].items():
+        sold[gyle] = sum(info['customers'].values())
+    return sold
+
+
+def used_up_batches(inventory: dict, sold: dict) -> dict:
+    """
+    Returns the bottled batches whose bottles have all been ordered
+
+    Arguments:
+    inventory - dictionary of batch data keyed by gyle number
+    sold - the number of bottles ordered from each gyle
+    """
+    used_up = {}
+    for gyle, batchdata in inventory.items():
+        if (batchdata['id'] == -1
+                and sold.get(gyle, 0) >= brewery.batch_bottles(batchdata)):
+            used_up[gyle] = batchdata
+    return used_up
+
+
+def append_records(records: list, path: str = ARCHIVE_FILE) -> None:
+    """
+    Appends records to the archive and waits until they are on disk
+
+    Each call adds a new compressed member to the end of the file, so
+    records already archived are never rewritten.
+
+    Arguments:
+    records - list of dictionaries to archive
+    path - the path of the archive
+    """
+    lines = "".join(json.dumps(record) + "\n" for record in records)
+    with open(path, 'ab') as f:
+        f.write(gzip.compress(lines.encode('utf-8')))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def archive_batches(path: str = ARCHIVE_FILE) -> int:
+    """
+    Archives the used up bottled batches and returns how many were moved
+
+    The batches are written to the archive before they are removed from
+    the state file, so a batch is never lost if the program stops part
+    way. A batch which was archived but is still in the state file is
+    archived again next time, and only the last copy is read back.
+
+    Arguments:
+    path - the path of the archive
+    """
+    sold = sold_bottles()
+    candidates = used_up_batches(brewery.read_data('inventory'), sold)
+    if not candidates:
+        return 0
+    today = datetime.today().strftime('%Y-%m-%d')
+    records = []
+    for gyle, batchdata in candidates.items():
+        record = dict(batchdata)
+        record['bottles'] = brewery.batch_bottles(batchdata)
+        record['sold'] = sold.get(gyle, 0)
+        record['archived'] = today
+        records.append(record)
+    append_records(records, path)
+    moved = []
+
+    def change(data):
+        moved.clear()
+        archived = brewery.get_archived(data)
+        for gyle, batchdata in candidates.items():
+            if data['inventory'].get(gyle) != batchdata:
+                continue  # batch changed since it was archived
+            del data['inventory'][gyle]
+            recipe = batchdata['recipe']
+            for section, amount in (('bottles',
+                                     brewery.batch_bottles(batchdata)),
+                                    ('batches', 1)):
+                archived[section][recipe] = (
+                    archived[section].get(recipe, 0) + amount)
+            archived['max_gyle'] = max(archived['max_gyle'],
+                                       int(batchdata['gyle']))
+            moved.append(gyle)
+    brewery.modify_data(change)
+    logging.info("%d bottled batches archived" % len(moved))
+    return len(moved)
+
+
+def iter_archive(path: str = ARCHIVE_FILE) -> Iterator[dict]:
+    """
+    Yields each archived batch, oldest first
+
+    A batch archived more than once is only yielded once, as its last
+    copy.
+
+    Arguments:
+    path - the path of the archive
+    """
+    if not os.path.exists(path):
+        return
+    last = {}  # line of the last copy of each gyle
+    with gzip.open(path, 'rt') as f:
+        for number, line in enumerate(f):
+            last[json.loads(line)['gyle']] = number
+    with gzip.open(path, 'rt') as f:
+        for number, line in enumerate(f):
+            record = json.loads(line)
+            if last[record['gyle']] == number:
+                yield record
+
+
+def query_archive(recipe: str = None, first_gyle: int = None,
+                  last_gyle: int = None, path: str = ARCHIVE_FILE) -> list:
+    """
+    Returns the archived batches matching the given conditions
+
+    Arguments:
+    recipe - only batches of this beer (optional)
+    first_gyle - only batches with this gyle number or later (optional)
+    last_gyle - only batches with this gyle number or earlier (optional)
+    path - the path of the archive
+    """
+    matches = []
+    for record in iter_archive(path):
+        if recipe is not None and record['recipe'] != recipe:
+            continue
+        if first_gyle is not None and int(record['gyle']) < first_gyle:
+            continue
+        if last_gyle is not None and int(record['gyle']) > last_gyle:
+            continue
+        matches.append(record)
+    return matches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Archive used up bottled batches")
+    parser.add_argument('command', choices=('run', 'list'))
+    parser.add_argument('--recipe')
+    parser.add_argument('--first', type=int, help="first gyle number")
+    parser.add_argument('--last', type=int, help="last gyle number")
+    options = parser.parse_args()
+    if options.command == 'run':
+        print("%d batches archived" % archive_batches())
+    else:
+        for record in query_archive(options.recipe, options.first,
+                                    options.last):
+            print("Gyle %s: %s, %d bottles, archived %s" % (
+                record['gyle'], record['recipe'], record['bottles'],
+                record['archived']))
@@ -0,0 +1,146 @@
+"""
+This module models the bottling line, which bottles one batch at a time.
+
+Conditioned batches wait in a queue and the line takes the waiting
+batch with the highest priority (the lowest number) next, or the one
+which has waited longest if their priorities are the same. Each batch
+takes as long as its bottles take to fill at the line's rate, which
+gives the time each batch will finish bottling.
+"""
+import heapq
+from datetime import datetime, timedelta
+from models import BOTTLE_ML, litres_to_ml
+
+BOTTLES_PER_HOUR = 1000  # bottles filled by the line each hour
+DEFAULT_PRIORITY = 5  # batches with lower numbers are bottled first
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def bottling_hours(bottles: int, rate: int = BOTTLES_PER_HOUR) -> float:
+    """
+    Returns the number of hours the line takes to fill some bottles
+
+    Arguments:
+    bottles - the number of bottles to fill
+    rate - the number of bottles the line fills each hour
+    """
+    if rate <= 0:
+        raise ValueError("The bottling line must fill at least one bottle "
+                         "an hour")
+    return bottles / float(rate)
+
+
+def queued_time(batchdata: dict, now: datetime) -> datetime:
+    """
+    Returns the time a batch joined the bottling queue
+
+    Batches moved to bottling before the queue was recorded are treated
+    as joining it now.
+
+    Arguments:
+    batchdata - dictionary containing the batch data
+    now - the current time
+    """
+    if batchdata.get('queued'):
+        return datetime.strptime(batchdata['queued'], TIME_FORMAT)
+    return now
+
+
+def schedule(batches: list, rate: int = BOTTLES_PER_HOUR,
+             now: datetime = None) -> dict:
+    """
+    Works out when each batch in the queue will be bottled
+
+    The line is followed from the time the first batch joined the queue.
+    Whenever it is free it starts the waiting batch with the highest
+    priority (a heap ordered by priority, time queued and gyle number);
+    if no batch is waiting it stays idle until the next one arrives.
+    The result is keyed by gyle number, and each entry has the 'start'
+    and 'finish' times, 'bottles', 'recipe' and 'position' in the queue.
+
+    Arguments:
+    batches - list of dictionaries of the batch data of queued batches
+    rate - the number of bottles the line fills each hour
+    now - the current time (now if omitted)
+    """
+    if now is None:
+        now = datetime.now()
+    arrivals = []  # (time queued, gyle, batch data) in order of arrival
+    for batchdata in batches:
+        arrivals.append((queued_time(batchdata, now), int(batchdata['gyle']),
+                         batchdata))
+    arrivals.sort(key=lambda arrival: arrival[:2])
+    waiting = []  # heap of (priority, time queued, gyle, batch data)
+    result = {}
+    line_free = arrivals[0][0] if arrivals else now
+    next_arrival = 0
+    while next_arrival < len(arrivals) or waiting:
+        if not waiting and arrivals[next_arrival][0] > line_free:
+            line_free = arrivals[next_arrival][0]  # line idle until then
+        while (next_arrival < len(arrivals)
+               and arrivals[next_arrival][0] <= line_free):
+            queued, gyle, batchdata = arrivals[next_arrival]
+            heapq.heappush(waiting, (
+                batchdata.get('priority', DEFAULT_PRIORITY), queued, gyle,
+                batchdata))
+            next_arrival += 1
+        priority, queued, gyle, batchdata = heapq.heappop(waiting)
+        bottles = litres_to_ml(batchdata['volume']) // BOTTLE_ML
+        finish = line_free + timedelta(hours=bottling_hours(bottles, rate))
+        result[str(gyle)] = {
+            'start': line_free,
+            'finish': finish,
+            'bottles': bottles,
+            'recipe': batchdata['recipe'],
+            'position': len(result) + 1}
+        line_free = finish
+    return result
+
+
+def line_free_days(entries: dict, today: datetime) -> float:
+    """
+    Returns the number of days from a date until the line is free
+
+    Arguments:
+    entries - the bottling schedule (see schedule)
+    today - the date to count from
+    """
+    if not entries:
+        return 0.0
+    last = max(entry['finish'] for entry in entries.values())
+    return max((last - today).total_seconds() / 86400, 0.0)
+
+
+def bottled_by(entries: dict, until: datetime) -> dict:
+    """
+    Returns the bottles of each beer the line will have filled by a time
+
+    Arguments:
+    entries - the bottling schedule (see schedule)
+    until - the time to count bottles up to
+    """
+    bottles = {}
+    for entry in entries.values():
+        if entry['finish'] <= until:
+            recipe = entry['recipe']
+            bottles[recipe] = bottles.get(recipe, 0) + entry['bottles']
+    return bottles
+
+
+def describe(entry: dict, now: datetime = None) -> str:
+    """
+    Returns the time remaining shown for a batch on the bottling line
+
+    Arguments:
+    entry - the schedule entry of the batch
+    now - the current time (now if omitted)
+    """
+    if now is None:
+        now = datetime.now()
+    if entry['finish'] <= now:
+        return "Bottled, ready for the inventory"
+    if entry['start'] > now:
+        return "Queued (%d on the line), bottled by %s" % (
+            entry['position'], entry['finish'].strftime('%Y-%m-%d %H:%M'))
+    return "Bottling, finished by %s" % entry['finish'].strftime(
+        '%Y-%m-%d %H:%M')
@@ -4,7 +4,37 @@ for each batch in production, as well as the states of each batch and
 the equipment.
 """
 import json
+import logging
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from models import STATES, Batch, BatchColumns, Container, litres_to_ml
+import bottling
+import telemetry
+try:
+    import fcntl
+except ImportError:  # file locks on Windows use msvcrt instead
+    fcntl = None
+    import msvcrt
+
+RECIPES = ('Organic Red Helles', 'Organic Pilsner', 'Organic Dunkel')
+STATE_FILE = 'config.json'
+LOCK_FILE = 'config.json.lock'
+FERMENTATION_DAYS = 28  # length of each stage of production
+CONDITIONING_DAYS = 14
+RETRY_DELAY = 0.05  # seconds waited before the first retry of an update
+NEXT_STAGE = {  # the stage each stage of production moves on to
+    'hot brew': "fermentation",
+    'fermentation': "conditioning",
+    'conditioning': "bottling",
+    'bottling': "bottled"}
+
+
+class ConflictError(Exception):
+    """Raised when the state file was changed by another program"""
 
 
 def read_data(type: str = "") -> dict:
@@ -15,7 +45,7 @@ def read_data(type: str = "") -> dict:
     type - The category of data to be fetched from the JSON file.
     """
     try:
-        with open('config.json', 'r') as f:  # all json file data is loaded
+        with open(STATE_FILE, 'r') as f:  # all json file data is loaded
             data = json.load(f)
     except BaseException:
         logging.error("FATAL ERROR: config.json file missing")
@@ -48,25 +78,20 @@ def get_possible_containers(
     batch - dictionary containing the current batch data
     """
     possible_containers = {}
+    volume_ml = litres_to_ml(volume)
     containers = read_data("containers")  # container data read in
-    for container, data in containers.items():
-        if (data["fermenter"] == fermenter or data["conditioner"]
-                == conditioner) and data["volume"] >= volume:
-            if data["occupied"] == False:  # if criteria for possible container met
-                possible_containers[container] = data  # container added
-            else:
-                if data['id'] == batch['id']:
-                    if data['conditioner']:
-                        if batch['state'] == 'fermentation':
-                            # batches can use the container they are in
-                            possible_containers[container] = {
-                                'state': "Can be used again by this batch"}
-    for container, data in possible_containers.items():
-        for attribute, value in data.items():
-            if attribute in ("volume", "fermenter", "conditioner", "state"):
-                output = value
-                if value or value == False:
-                    output = ("No", "Yes")[value]  # False/True converted
+    for name, data in containers.items():
+        tank = Container.from_dict(name, data)
+        if not ((tank.fermenter == fermenter or tank.conditioner
+                 == conditioner) and tank.can_hold(volume_ml)):
+            continue
+        if not tank.occupied:  # if criteria for possible container met
+            possible_containers[name] = data  # container added
+        elif (tank.id == batch['id'] and tank.conditioner
+              and batch['state'] == 'fermentation'):
+            # batches can use the container they are in
+            possible_containers[name] = {
+                'state': "Can be used again by this batch"}
     return possible_containers  # list of possible containers returned
 
 
@@ -79,38 +104,56 @@ def get_batch_data(batch_to_edit: str) -> dict:
     return current_batch  # batch data return
 
 
-def get_production_batches() -> list:
+def get_production_rows() -> dict:
     """
-    Returns a list of strings containing information about all batches
+    Returns the information shown about each batch in production
 
-    This function reads in every batch in production from a JSON file,
-    and constructs a string containing the recipe, gyle number,
-    container (if applicable), the state time remaining, and volume of#
-    the batch in production.
-    This string is later printed to the form in a list of production
-    batches.
+    The rows are dictionaries containing the recipe, gyle number,
+    container (if applicable), state, time remaining and volume of each
+    batch, keyed by gyle number, so the list on the form can tell which
+    rows have changed since it was last drawn. The time remaining of
+    batches on the bottling line comes from the line's schedule.
     """
-    strings = []
+    rows = {}
     data = read_data()
+    line = bottling_schedule(data)
+    tanks = {}  # container of each container id
+    for container, info in data['containers'].items():
+        tanks[info['id']] = (container, info)
     for batch, batchdata in data['inventory'].items():
         time_remaining = "Less than 5 hours"
         if batchdata['id'] != -1:  # if batch is in production
             batch_container = None
-            for container, info in data['containers'].items():
-                if batchdata['id'] == info['id']:  # if batch in container
-                    batch_container = container
-                    time_remaining = calculate_time(info)
-            if batchdata['id'] == 10:  # if batch is in bottling phase
-                time_remaining = "Less than 12 hours"  # bottling time
-            strings.append(
-                "Recipe: %s\nGyle Number: %s\nContainer: %s\nState: %s\nTime Remaining: %s\nVolume: %d litres\n" %
-                (batchdata['recipe'],
-                 batch,
-                 batch_container,
-                 batchdata['state'],
-                    time_remaining,
-                    batchdata['volume']))
-    return strings
+            if batchdata['id'] in tanks:  # if batch in container
+                batch_container, info = tanks[batchdata['id']]
+                time_remaining = calculate_time(info)
+            if batch in line:  # if batch is in bottling phase
+                time_remaining = bottling.describe(line[batch])
+            rows[batch] = {
+                'recipe': batchdata['recipe'],
+                'gyle': batch,
+                'container': batch_container,
+                'state': batchdata['state'],
+                'time': time_remaining,
+                'volume': batchdata['volume']}
+    return rows
+
+
+def format_production_batch(row: dict) -> str:
+    """
+    Returns the text shown for a batch in the list of production batches
+
+    Arguments:
+    row - dictionary containing the information about the batch
+    """
+    return ("Recipe: %s\nGyle Number: %s\nContainer: %s\nState: %s\n"
+            "Time Remaining: %s\nVolume: %d litres\n" %
+            (row['recipe'],
+             row['gyle'],
+             row['container'],
+             row['state'],
+             row['time'],
+             row['volume']))
 
 
 def update_containers(
@@ -123,6 +166,9 @@ def update_containers(
 
     When a batch is moved to a new tank this subroutine updates the states
     of the batch and the containers and writes the new states to the file.
+    The batch is moved as it is in the file, and a ConflictError is
+    raised if another program has moved or removed it since the caller
+    read it, rather than moving it on from an out of date copy.
 
     Arguments:
     batchdata - dictionary which contains data about the batch
@@ -130,24 +176,21 @@ def update_containers(
     state - the state in which the batch is being moved into
     selection - the container which the user has selected
     """
-    data = read_data()
-    if batchdata['id'] > 0:
-        for container, values in data['containers'].items():
-            if values['id'] == batchdata['id']:
-                values['occupied'] = False
-                values['finish'] = "-1"
-    if selection == "bottling":
-        batchdata['id'] = 10
-    batchdata['state'] = state
-    for container, values in data['containers'].items():
-        if container == selection:
-            values['occupied'] = True
-            values['finish'] = finish_time
-            batchdata['id'] = values['id']
-    batch = {str(batchdata['gyle']): batchdata}
-    data['inventory'].update(batch)
-    with open("config.json", "w") as f:
-        json.dump(data, f)
+    gyle = str(batchdata['gyle'])
+    moved = {}
+
+    def change(data):
+        current = data['inventory'].get(gyle)
+        if (current is None or current['state'] != batchdata['state']
+                or current['id'] != batchdata['id']):
+            raise ConflictError("Batch %s was changed by another program"
+                                % gyle)
+        moved.clear()
+        moved.update(current)  # each attempt starts from the file's batch
+        move_batch(data, moved, finish_time, state, selection)
+    modify_data(change)
+    batchdata.clear()
+    batchdata.update(moved)
 
 
 def calculate_time(info: dict) -> str:
@@ -179,25 +222,12 @@ def delete_batch(batch: int) -> None:
     Arguments:
     batch - the gyle number of the batch to be removed
     """
-    data = read_data()
-    for id, batches in data['inventory'].items():
-        if id == str(batch):
-            batchdata = batches
-    for container, values in data['containers'].items():
-        if values['id'] == batchdata['id']:
-            values['occupied'] = False
-            values['finish'] = "-1"
-    data['inventory'].pop(str(batch))
-    with open("config.json", "w") as f:
-        json.dump(data, f)
+    modify_data(lambda data: remove_batch(data, batch))
 
 
 def add_batch_to_inventory(batch: dict) -> None:
-    """Adds a batch to the inventory"""
-    batch['id'] = -1
-    batch['state'] = "bottled"
-    batch_to_update = {str(batch['gyle']): batch}
-    add_brew(batch_to_update)
+    """Adds a batch which has been bottled to the inventory"""
+    update_containers(batch, "", "bottled", "inventory")
 
 
 def calculate_finish_time(fermenting: bool) -> str:
@@ -210,9 +240,9 @@ def calculate_finish_time(fermenting: bool) -> str:
     today = datetime.today().strftime('%Y-%m-%d')
     today_date = datetime.strptime(today, '%Y-%m-%d')
     if fermenting:
-        process_time = timedelta(days=28)
+        process_time = timedelta(days=FERMENTATION_DAYS)
     elif fermenting == False:
-        process_time = timedelta(days=14)
+        process_time = timedelta(days=CONDITIONING_DAYS)
     finish = today_date + process_time
     finish_time = datetime.strftime(finish, '%Y-%m-%d')
     return finish_time
@@ -225,16 +255,11 @@ def check_equipment_availability() -> bool:
     Arguments:
     volume - the volume of the batch that needs to fit in the tanks
     """
-    possible_containers = {}
-    data = read_data()
-    for container, value in data['containers'].items():
-        if (value["fermenter"]):
-            if not value["occupied"]:
-                possible_containers[container] = data
-    if possible_containers:
-        return True
-    else:
-        return False
+    for name, data in read_data("containers").items():
+        tank = Container.from_dict(name, data)
+        if tank.fermenter and not tank.occupied:
+            return True
+    return False
 
 
 def get_container(container_to_get: str) -> dict:
@@ -244,60 +269,586 @@ def get_container(container_to_get: str) -> dict:
     This function returns the useful information about a specific container
     when the user selects the container from a list of containers,
     and returns the information in a dictionary in a comprehensive form.
+    The latest temperature and gravity readings (if any) are included.
 
     Arguments:
     container_to_get - the container whose information should be fetched.
     """
     data = read_data()
-    for container, value in data['containers'].items():
-        if container == container_to_get.lower():
-            container_data = {}
-            container_data['name'] = container
-            recipe = ""
-            if value['occupied']:
-                container_data['status'] = "In Use"
-                for id, brew in data['inventory'].items():
-                    if brew['id'] == value['id']:
-                        container_data['recipe'] = brew['recipe']
-            else:
-                container_data['status'] = "Available"
-            for attribute, info in value.items():
-                if attribute in (
-                    "volume",
-                    "fermenter",
-                    "conditioner",
-                        "state"):
-                    output = info
-                    if info in (False, True):
-                        output = ("No", "Yes")[info]
-                    container_data[str(attribute).capitalize()] = str(output)
+    name = container_to_get.lower()
+    tank = Container.from_dict(name, data['containers'][name])
+    container_data = {'name': name}
+    if tank.occupied:
+        container_data['status'] = "In Use"
+        for id, brew in data['inventory'].items():
+            if brew['id'] == tank.id:
+                container_data['recipe'] = brew['recipe']
+    else:
+        container_data['status'] = "Available"
+    container_data.update(tank.describe())  # volume and capabilities as text
+    container_data.update(telemetry.summary(name))  # latest sensor readings
     return container_data
 
 
 def add_brew(batch: dict) -> None:
-    """Adds a new batch to the system"""
-    data = read_data()
+    """
+    Adds new batches to the system
+
+    A ValueError is raised if a batch with one of the gyle numbers
+    already exists, e.g. when another program has added a batch with
+    the same new gyle number, so neither batch is lost.
+
+    Arguments:
+    batch - dictionary of batch data keyed by gyle number
+    """
+    def change(data):
+        for gyle in batch:
+            if gyle in data['inventory']:
+                raise ValueError("Batch %s already exists" % gyle)
+        store_batches(data, batch)
+    modify_data(change)
+
+
+def store_batches(data: dict, batch: dict) -> None:
+    """
+    Adds or replaces batches in the data and updates the inventory totals
+
+    Arguments:
+    data - dictionary containing all of the container and inventory data
+    batch - dictionary of batch data keyed by gyle number
+    """
+    totals = get_totals(data)
+    queue = get_bottling_queue(data)
+    for gyle, batchdata in batch.items():
+        if gyle in data['inventory']:  # replaced batch removed from totals
+            update_totals(totals, data['inventory'][gyle], -1)
+        update_totals(totals, batchdata, 1)
+        if batchdata['id'] == 10 and gyle not in queue:
+            queue.append(gyle)  # batch joined the bottling line
+        elif batchdata['id'] != 10 and gyle in queue:
+            queue.remove(gyle)
     data['inventory'].update(batch)
-    with open("config.json", "w") as f:
-        json.dump(data, f)
+
+
+def move_batch(
+        data: dict,
+        batchdata: dict,
+        finish_time: str,
+        state: str,
+        selection: str) -> None:
+    """
+    Moves a batch into a container or the bottling stage within the data
+
+    The container the batch was in is freed first, so a batch can stay
+    in the same tank. A ValueError is raised if the batch is not moving
+    on to its next stage (hot brew, fermentation, conditioning, bottling,
+    then "bottled" in the "inventory"), or if the selected container does
+    not exist, is in use, is too small for the batch or cannot be used
+    for the stage (a fermenter for fermentation and a conditioner for
+    conditioning, as in get_possible_containers).
+
+    Arguments:
+    data - dictionary containing all of the container and inventory data
+    batchdata - dictionary which contains data about the batch
+    finish_time - string which contains the date on which the stage finishes
+    state - the state in which the batch is being moved into
+    selection - the container which the user has selected
+    """
+    gyle = batchdata['gyle']
+    if NEXT_STAGE.get(batchdata['state']) != state:
+        raise ValueError("Batch %s cannot be moved from %s to %s" %
+                         (gyle, batchdata['state'], state))
+    if state in ("bottling", "bottled"):
+        place = "bottling" if state == "bottling" else "inventory"
+        if selection != place:
+            raise ValueError("Batch %s must be moved to %s, not %s" %
+                             (gyle, place, selection))
+    else:
+        if selection not in data['containers']:
+            raise ValueError("There is no container called %s" % selection)
+        chosen = data['containers'][selection]
+        if chosen['occupied'] and chosen['id'] != batchdata['id']:
+            raise ValueError("Container %s is already in use" % selection)
+        tank = Container.from_dict(selection, chosen)
+        if not tank.can_hold(litres_to_ml(batchdata['volume'])):
+            raise ValueError("Container %s is too small for batch %s" %
+                             (selection, gyle))
+        if not (tank.fermenter if state == "fermentation"
+                else tank.conditioner):
+            raise ValueError("Container %s cannot be used for %s" %
+                             (selection, state))
+    if batchdata['id'] > 0:
+        for container, values in data['containers'].items():
+            if values['id'] == batchdata['id']:
+                values['occupied'] = False
+                values['finish'] = "-1"
+    if selection == "bottling":
+        batchdata['id'] = 10
+        batchdata['queued'] = datetime.now().strftime(bottling.TIME_FORMAT)
+    elif selection == "inventory":  # batch has left the bottling line
+        batchdata['id'] = -1
+        batchdata.pop('queued', None)
+        batchdata.pop('priority', None)
+    batchdata['state'] = state
+    for container, values in data['containers'].items():
+        if container == selection:
+            values['occupied'] = True
+            values['finish'] = finish_time
+            batchdata['id'] = values['id']
+    store_batches(data, {str(batchdata['gyle']): batchdata})
+
+
+def remove_batch(data: dict, batch: int) -> None:
+    """
+    Removes a batch from the data, freeing its container
+
+    A ValueError is raised if there is no batch with the gyle number.
+
+    Arguments:
+    data - dictionary containing all of the container and inventory data
+    batch - the gyle number of the batch to be removed
+    """
+    if str(batch) not in data['inventory']:
+        raise ValueError("There is no batch with the gyle number %s" % batch)
+    batchdata = data['inventory'][str(batch)]
+    for container, values in data['containers'].items():
+        if values['id'] == batchdata['id']:
+            values['occupied'] = False
+            values['finish'] = "-1"
+    update_totals(get_totals(data), batchdata, -1)  # batch taken off totals
+    if str(batch) in get_bottling_queue(data):
+        data['bottling'].remove(str(batch))
+    data['inventory'].pop(str(batch))
+
+
+def apply_operations(operations: list) -> None:
+    """
+    Applies a list of batch operations as a single transaction
+
+    Every operation is checked and applied in order to one copy of the
+    data, which is only written to the file once all of them succeed.
+    If any operation fails a ValueError is raised and nothing is saved.
+    Once saved, each operation is logged with the same message as when
+    it is done on the form, so the log analysis counts it.
+    Each operation is a dictionary with an 'action' of:
+    'add' - adds a new 'batch' (dictionary of batch data with a gyle),
+            which starts in the hot brew stage outside any container
+    'move' - moves batch 'gyle' into 'container' (or "bottling", or
+             "inventory" when 'state' is "bottled") in its next 'state',
+             optionally with a 'finish' date
+    'delete' - removes batch 'gyle'
+
+    Arguments:
+    operations - list of dictionaries describing each operation
+    """
+    messages = []
+
+    def change(data):
+        messages.clear()  # each attempt starts again from the file
+        for number, operation in enumerate(operations, 1):
+            try:
+                messages.append(apply_operation(data, operation))
+            except (KeyError, TypeError, ValueError) as error:
+                raise ValueError("Operation %d failed: %s" % (number, error))
+    modify_data(change)  # all operations saved together
+    for message in messages:
+        logging.info(message)
+    logging.info("%d batch operations applied" % len(operations))
+
+
+def apply_operation(data: dict, operation: dict) -> None:
+    """
+    Checks and applies one batch operation to the data
+
+    Returns the message to log for the operation once it has been saved.
+
+    Arguments:
+    data - dictionary containing all of the container and inventory data
+    operation - dictionary describing the operation (see apply_operations)
+    """
+    action = operation['action']
+    if action == "add":
+        batch = Batch.from_dict(dict(
+            {'id': 0, 'state': "hot brew"}, **operation['batch']))
+        if str(batch.gyle) in data['inventory']:
+            raise ValueError("Batch %s already exists" % batch.gyle)
+        if batch.id != 0 or batch.state != STATES[0]:
+            raise ValueError("New batches must start in the hot brew stage "
+                             "(id 0), then be moved on")
+        if batch.recipe not in RECIPES:
+            raise ValueError("Unknown recipe %s" % batch.recipe)
+        if not 0 < batch.volume_ml <= litres_to_ml(1000):
+            raise ValueError("Batches must be between 1 and 1000 litres")
+        store_batches(data, {str(batch.gyle): batch.to_dict()})
+        return ("New batch with gyle number %d created (%s, %d litres)" %
+                (batch.gyle, batch.recipe, batch.volume_ml // 1000))
+    elif action == "move":
+        gyle = str(operation['gyle'])
+        if gyle not in data['inventory']:
+            raise ValueError("There is no batch with the gyle number %s" %
+                             gyle)
+        batchdata = dict(data['inventory'][gyle])
+        finish_time = operation.get('finish')
+        if finish_time is None:  # finish date from the length of the stage
+            finish_time = ""
+            if operation['state'] in ("fermentation", "conditioning"):
+                finish_time = calculate_finish_time(
+                    operation['state'] == "fermentation")
+        state = operation['state']
+        selection = operation['container']
+        move_batch(data, batchdata, finish_time, state, selection)
+        if state == "bottled":
+            return "Batch %d successfully moved to the inventory." % int(gyle)
+        if state == "bottling":
+            return "Batch %d successfully moved to the %s phase." % (
+                int(gyle), state)
+        return "Batch %d successfully moved to the %s phase in %s." % (
+            int(gyle), state, selection)
+    elif action == "delete":
+        remove_batch(data, operation['gyle'])
+        return "Batch %d deleted" % int(operation['gyle'])
+    else:
+        raise ValueError("Unknown action %s" % action)
+
+
+def add_brews(batches: list) -> None:
+    """
+    Adds many new batches to the system in one transaction
+
+    Arguments:
+    batches - list of dictionaries of batch data, each with a gyle number
+    """
+    apply_operations([{'action': "add", 'batch': batch} for batch in batches])
+
+
+def move_batches(moves: list) -> None:
+    """
+    Moves many batches to their next stage in one transaction
+
+    Arguments:
+    moves - list of dictionaries with the 'gyle', next 'state' and
+            'container' of each batch, and optionally the 'finish' date
+            of the stage
+    """
+    apply_operations([dict(move, action="move") for move in moves])
+
+
+def delete_batches(batches: list) -> None:
+    """
+    Removes many batches from the system in one transaction
+
+    Arguments:
+    batches - list of the gyle numbers of the batches to be removed
+    """
+    apply_operations([{'action': "delete", 'gyle': batch}
+                      for batch in batches])
 
 
 def bottled_beers() -> dict:
     """
-    Calculates the number of bottled beers from the finished batches
+    Returns the number of bottled beers from the finished batches
 
-    This function calculates the number of bottles of each beer in the
-    inventory by dividing the volume (in litres) by 0.5 (as each bottle
-    is 500ml, half a litre). The function returns a dictionary with the
-    beer counts.
+    The bottle counts are read from the inventory totals, which are
+    kept up to date whenever a batch is added, moved or deleted, so
+    the finished batches do not need to be scanned. Batches which the
+    bottling line has finished but which have not been added to the
+    inventory yet are counted too. Each bottle is 500ml, half a litre.
     """
-    data = read_data('inventory')
+    data = read_data()
+    totals = get_totals(data)
     beers = {
         'Organic Red Helles': 0,
         'Organic Dunkel': 0,
         'Organic Pilsner': 0}
-    for id, beer in data.items():
-        if beer['id'] == -1:
-            bottles = beer['volume'] // 0.5
-            beers[beer['recipe']] += bottles
+    for recipe, bottles in totals['bottled'].items():
+        beers[recipe] = bottles
+    finished = bottling.bottled_by(bottling_schedule(data), datetime.now())
+    for recipe, bottles in finished.items():
+        beers[recipe] = beers.get(recipe, 0) + bottles
     return beers
+
+
+def get_bottling_queue(data: dict) -> list:
+    """
+    Returns the gyle numbers of the batches on the bottling line
+
+    The queue is kept in the data so the inventory does not need to be
+    scanned for it; if the state file has no queue yet it is found from
+    the batches and stored in the data.
+
+    Arguments:
+    data - dictionary containing all of the container and inventory data
+    """
+    if 'bottling' not in data:
+        data['bottling'] = [gyle for gyle, batchdata in
+                            data['inventory'].items() if batchdata['id'] == 10]
+    return data['bottling']
+
+
+def bottling_schedule(data: dict = None,
+                      rate: int = bottling.BOTTLES_PER_HOUR) -> dict:
+    """
+    Returns when each batch on the bottling line will be bottled
+
+    Arguments:
+    data - dictionary containing all of the data (read from file if omitted)
+    rate - the number of bottles the line fills each hour
+    """
+    if data is None:
+        data = read_data()
+    batches = [data['inventory'][gyle] for gyle in get_bottling_queue(data)]
+    return bottling.schedule(batches, rate)
+
+
+def set_bottling_priority(batch: int, priority: int) -> None:
+    """
+    Changes how soon a batch on the bottling line is bottled
+
+    Batches with a lower priority number are bottled first. A ValueError
+    is raised if the batch is not on the bottling line.
+
+    Arguments:
+    batch - the gyle number of the batch
+    priority - the new priority of the batch
+    """
+    def change(data):
+        if str(batch) not in get_bottling_queue(data):
+            raise ValueError("Batch %s is not on the bottling line" % batch)
+        data['inventory'][str(batch)]['priority'] = int(priority)
+    modify_data(change)
+    logging.info("Batch %s given bottling priority %d" % (batch, priority))
+
+
+def state_fingerprint() -> tuple:
+    """
+    Returns a fingerprint of the state file
+
+    The fingerprint is made from the name, modification time and size of
+    the file, so it changes whenever the state file is written.
+    """
+    stat = os.stat(STATE_FILE)
+    return (STATE_FILE, stat.st_mtime_ns, stat.st_size)
+
+
+@contextmanager
+def state_lock():
+    """
+    Holds an exclusive lock on the state file while changes are written
+
+    Only programs writing to the state file take the lock, so reading
+    is never held up by a write.
+    """
+    with open(LOCK_FILE, 'a+') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def write_data(data: dict) -> None:
+    """
+    Writes container and inventory data back to the JSON file
+
+    The data carries a version number which is increased on every write.
+    If the file has been written by another program since the data was
+    read, a ConflictError is raised instead of overwriting its changes.
+    The data is written to a temporary file which then replaces the
+    state file, so readers never see a half-written file.
+
+    Arguments:
+    data - dictionary containing all of the container and inventory data
+    """
+    with state_lock():
+        current = 0
+        if os.path.exists(STATE_FILE):
+            with open(STATE_FILE, 'r') as f:
+                current = json.load(f).get('version', 0)
+        if data.get('version', 0) != current:
+            raise ConflictError(
+                "config.json was changed by another program (version %d, "
+                "expected %d)" % (current, data.get('version', 0)))
+        data['version'] = current + 1
+        folder = os.path.dirname(os.path.abspath(STATE_FILE))
+        handle, temporary = tempfile.mkstemp(
+            dir=folder, prefix=STATE_FILE + '.', suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'w') as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            for attempt in range(10):
+                try:
+                    os.replace(temporary, STATE_FILE)
+                    break
+                except PermissionError:  # file open by a reader on Windows
+                    if attempt == 9:
+                        raise
+                    time.sleep(0.05)
+        except BaseException:
+            data['version'] = current
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+
+def modify_data(change, retries: int = 5) -> dict:
+    """
+    Reads the state, applies a change to it and writes it back
+
+    If another program writes to the state file in between, the change
+    is applied again to the newly read state, up to a number of retries,
+    after which the ConflictError is raised. Each retry waits a random
+    time, up to twice as long as the one before, so programs which keep
+    colliding spread their writes out.
+
+    Arguments:
+    change - function which takes the data dictionary and changes it
+    retries - the number of times to retry after a conflicting write
+    """
+    for attempt in range(retries + 1):
+        data = read_data()
+        change(data)
+        try:
+            write_data(data)
+            return data
+        except ConflictError:
+            if attempt == retries:
+                logging.error("ERROR config.json kept changing, "
+                              "update abandoned")
+                raise
+            logging.warning("WARNING config.json changed by another "
+                            "program, retrying update")
+            time.sleep(random.uniform(0, RETRY_DELAY * 2 ** attempt))
+
+
+def batch_bottles(batchdata: dict) -> int:
+    """Returns the number of 500ml bottles a batch will fill"""
+    return Batch.from_dict(batchdata).bottles
+
+
+def calculate_totals(inventory: dict, archived: dict = None) -> dict:
+    """
+    Calculates the bottle totals of each beer by scanning every batch
+
+    The totals are split into the bottles which have been finished
+    ('bottled') and the bottles which are still in production
+    ('production'). The container, volume and recipe of the batches are
+    packed into typed arrays (see models.BatchColumns) which are then
+    scanned, rather than making a Batch for each one. Bottles of archived
+    batches are added to the bottled totals.
+
+    Arguments:
+    inventory - dictionary containing every batch in the inventory
+    archived - the archived totals (see get_archived), if any
+    """
+    totals = {'bottled': {}, 'production': {}}
+    for recipe in RECIPES:
+        totals['bottled'][recipe] = 0
+        totals['production'][recipe] = 0
+    scanned = BatchColumns.from_inventory(inventory).bottle_totals()
+    for section in totals:
+        totals[section].update(scanned[section])
+    if archived:
+        for recipe, bottles in archived['bottles'].items():
+            totals['bottled'][recipe] = (
+                totals['bottled'].get(recipe, 0) + bottles)
+    return totals
+
+
+def update_totals(totals: dict, batchdata: dict, sign: int) -> None:
+    """
+    Adds or removes the bottles of one batch to the inventory totals
+
+    Arguments:
+    totals - the inventory totals to be updated
+    batchdata - dictionary containing the batch data
+    sign - 1 to add the batch to the totals, -1 to remove it
+    """
+    batch = Batch.from_dict(batchdata)
+    if batch.bottled:
+        section = totals['bottled']
+    else:
+        section = totals['production']
+    section[batch.recipe] = section.get(batch.recipe, 0) + sign * batch.bottles
+
+
+def get_totals(data: dict = None) -> dict:
+    """
+    Returns the bottle totals of each beer, bottled and in production
+
+    If the state file has no totals yet they are calculated from the
+    inventory and stored in the data, so they are saved on the next write.
+
+    Arguments:
+    data - dictionary containing all of the data (read from file if omitted)
+    """
+    if data is None:
+        data = read_data()
+    if 'totals' not in data:  # totals built from the batches once
+        data['totals'] = calculate_totals(data['inventory'],
+                                          data.get('archived'))
+    return data['totals']
+
+
+def get_archived(data: dict) -> dict:
+    """
+    Returns the totals of the batches moved to the archive
+
+    The totals hold the 'bottles' and number of 'batches' of each beer
+    which have been archived, and the highest archived gyle number
+    ('max_gyle'). They are added to the data if it has none yet.
+
+    Arguments:
+    data - dictionary containing all of the container and inventory data
+    """
+    if 'archived' not in data:
+        data['archived'] = {'bottles': {}, 'batches': {}, 'max_gyle': 0}
+    return data['archived']
+
+
+def verify_totals() -> bool:
+    """Checks the stored inventory totals against a full scan of batches"""
+    data = read_data()
+    expected = calculate_totals(data['inventory'], data.get('archived'))
+    if data.get('totals') != expected:
+        logging.error("ERROR Inventory totals do not match the batches")
+        return False
+    return True
+
+
+def rebuild_totals() -> dict:
+    """Recalculates the inventory totals from every batch and saves them"""
+    def change(data):
+        data['totals'] = calculate_totals(data['inventory'],
+                                          data.get('archived'))
+        data.pop('bottling', None)  # bottling queue found again
+        get_bottling_queue(data)
+    data = modify_data(change)
+    logging.info("Inventory totals rebuilt")
+    return data['totals']
+
+
+if __name__ == "__main__":
+    import sys
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    if command == "rebuild":
+        print(rebuild_totals())
+    elif command == "verify":
+        if verify_totals():
+            print("Inventory totals are correct")
+        else:
+            print("Inventory totals are out of date, run: "
+                  "python brewery.py rebuild")
+            sys.exit(1)
+    else:
+        print("Usage: python brewery.py [verify|rebuild]")
+        sys.exit(2)
@@ -0,0 +1,372 @@
+"""
+This module exports reports of the batches, containers, inventory and
+sales predictions to CSV or JSON Lines files.
+
+The state file is read a piece at a time and rows are written in
+chunks, so exports use the same small amount of memory however many
+batches have been recorded. Run it from the command line, e.g.
+    python export.py batches --format csv --output batches.csv
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sys
+from datetime import datetime
+from typing import Iterator
+import archive
+import brewery
+import prediction
+
+CHUNK_SIZE = 65536  # characters read from the state file at a time
+CHUNK_ROWS = 1000  # rows written to the output at a time
+WHITESPACE = re.compile(r'\s*')
+VALUE_ENDS = ' \t\r\n,]}'  # characters which can follow a complete number
+REPORTS = ('batches', 'containers', 'inventory', 'forecast', 'archive')
+FIELDS = {
+    'batches': ('gyle', 'recipe', 'state', 'volume', 'bottles', 'container'),
+    'containers': ('name', 'id', 'volume', 'fermenter', 'conditioner',
+                   'occupied', 'finish'),
+    'inventory': ('recipe', 'bottled', 'production', 'total'),
+    'forecast': ('month', 'recipe', 'average', 'prediction', 'growth'),
+    'archive': ('gyle', 'recipe', 'volume', 'bottles', 'sold', 'archived')}
+
+
+class JsonStream:
+    """
+    Reads the members of one object in a JSON file a piece at a time
+
+    Only the text of the member being read is held in memory, so very
+    large objects (such as the inventory) can be read one entry at a time.
+    """
+
+    def __init__(self, f):
+        self.file = f
+        self.buffer = ""
+        self.position = 0
+        self.finished = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self) -> bool:
+        """Reads the next piece of the file, returning False at the end"""
+        if self.finished:
+            return False
+        if self.position > CHUNK_SIZE:  # text already read is dropped
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+        chunk = self.file.read(CHUNK_SIZE)
+        if not chunk:
+            self.finished = True
+            return False
+        self.buffer += chunk
+        return True
+
+    def next_character(self) -> str:
+        """Skips whitespace and returns the next character without using it"""
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON file")
+
+    def expect(self, character: str) -> None:
+        """Uses the next character, which must be the one given"""
+        if self.next_character() != character:
+            raise ValueError("Expected '%s' in JSON file" % character)
+        self.position += 1
+
+    def value(self):
+        """
+        Reads the next complete JSON value
+
+        A number is only accepted once the character after it has been
+        read, so a number split between two pieces of the file (e.g. "12."
+        and "5") is not read as a shorter number.
+        """
+        self.next_character()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer,
+                                                     self.position)
+                if self.finished or (end < len(self.buffer) and (
+                        not isinstance(value, (int, float))
+                        or self.buffer[end] in VALUE_ENDS)):
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.finished:
+                    raise
+            self.fill()  # value (or a number) may carry on in the next piece
+
+    def skip(self) -> None:
+        """
+        Skips over the next JSON value
+
+        Objects are skipped one member at a time, so a large object such
+        as the inventory is never held in memory all at once.
+        """
+        if self.next_character() == "{":
+            for key, member in self.members():
+                member.value()
+        else:
+            self.value()
+
+    def members(self) -> Iterator[tuple]:
+        """Yields the (key, value) pairs of the object which comes next"""
+        self.expect("{")
+        if self.next_character() == "}":
+            self.position += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key, self
+            if self.next_character() == ",":
+                self.position += 1
+            else:
+                self.expect("}")
+                return
+
+
+def iter_state(section: str, path: str = None) -> Iterator[tuple]:
+    """
+    Yields the (key, value) pairs of one section of the state file
+
+    Arguments:
+    section - the name of the section, e.g. 'inventory' or 'containers'
+    path - the path of the state file (brewery.STATE_FILE if omitted)
+    """
+    with open(path or brewery.STATE_FILE, 'r') as f:
+        stream = JsonStream(f)
+        for key, reader in stream.members():
+            if key != section:
+                reader.skip()
+                continue
+            if reader.next_character() != "{":
+                return
+            for name, item in reader.members():
+                yield name, item.value()
+            return
+
+
+def iter_containers(path: str = None) -> Iterator[dict]:
+    """
+    Yields a row for each container in the state file
+
+    Arguments:
+    path - the path of the state file (brewery.STATE_FILE if omitted)
+    """
+    for name, container in iter_state('containers', path):
+        row = {'name': name}
+        for field in FIELDS['containers'][1:]:
+            row[field] = container.get(field)
+        yield row
+
+
+def iter_batches(path: str = None) -> Iterator[dict]:
+    """
+    Yields a row for each batch in the state file, one at a time
+
+    Arguments:
+    path - the path of the state file (brewery.STATE_FILE if omitted)
+    """
+    tanks = {}  # name of each container id
+    for row in iter_containers(path):
+        tanks[row['id']] = row['name']
+    for gyle, batch in iter_state('inventory', path):
+        container = tanks.get(batch['id'], "")
+        if batch['id'] == 10:
+            container = "bottling"
+        yield {
+            'gyle': gyle,
+            'recipe': batch['recipe'],
+            'state': batch['state'],
+            'volume': batch['volume'],
+            'bottles': brewery.batch_bottles(batch),
+            'container': container}
+
+
+def iter_inventory(path: str = None) -> Iterator[dict]:
+    """
+    Yields the bottled and in production totals of each beer
+
+    The stored totals are used; if the state file has none they are
+    added up from the batches one at a time.
+
+    Arguments:
+    path - the path of the state file (brewery.STATE_FILE if omitted)
+    """
+    totals = None
+    for section, values in iter_state('totals', path):
+        totals = totals or {}
+        totals[section] = values
+    if totals is None:
+        totals = {'bottled': {}, 'production': {}}
+        for gyle, batch in iter_state('inventory', path):
+            brewery.update_totals(totals, batch, 1)
+    recipes = list(brewery.RECIPES)
+    for section in totals.values():
+        recipes += [recipe for recipe in section if recipe not in recipes]
+    for recipe in recipes:
+        bottled = totals.get('bottled', {}).get(recipe, 0)
+        production = totals.get('production', {}).get(recipe, 0)
+        yield {'recipe': recipe, 'bottled': bottled,
+               'production': production, 'total': bottled + production}
+
+
+def iter_forecast(months: int = 3, model: str = "growth") -> Iterator[dict]:
+    """
+    Yields the predicted sales of each beer for each of the coming months
+
+    Arguments:
+    months - the number of months to predict for
+    model - the name of the forecasting model used for the predictions
+    """
+    for month in range(1, months + 1):
+        ratio, predictions = prediction.growth_rate(month, model)
+        for recipe, values in predictions.items():
+            yield {'month': month, 'recipe': recipe,
+                   'average': values['average'],
+                   'prediction': values['prediction'],
+                   'growth': values['growth']}
+
+
+def iter_archived() -> Iterator[dict]:
+    """Yields a row for each batch in the archive of used up batches"""
+    for record in archive.iter_archive():
+        yield {field: record.get(field) for field in FIELDS['archive']}
+
+
+def write_csv(rows: Iterator[dict], out, fields: tuple) -> int:
+    """
+    Writes rows to a CSV file in chunks and returns the number written
+
+    Arguments:
+    rows - iterator of dictionaries to write
+    out - the file to write to
+    fields - the names of the columns
+    """
+    chunk = io.StringIO()
+    writer = csv.DictWriter(chunk, fieldnames=fields, lineterminator="\n")
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % CHUNK_ROWS == 0:  # chunk written out and emptied
+            out.write(chunk.getvalue())
+            chunk.seek(0)
+            chunk.truncate()
+    out.write(chunk.getvalue())
+    return count
+
+
+def write_jsonl(rows: Iterator[dict], out) -> int:
+    """
+    Writes rows to a JSON Lines file in chunks and returns the number written
+
+    Arguments:
+    rows - iterator of dictionaries to write
+    out - the file to write to
+    """
+    lines = []
+    count = 0
+    for row in rows:
+        lines.append(json.dumps(row))
+        count += 1
+        if len(lines) == CHUNK_ROWS:  # chunk written out and emptied
+            out.write("\n".join(lines) + "\n")
+            lines = []
+    if lines:
+        out.write("\n".join(lines) + "\n")
+    return count
+
+
+def get_rows(report: str, path: str = None, months: int = 3,
+             model: str = "growth") -> Iterator[dict]:
+    """
+    Returns an iterator over the rows of a report
+
+    Arguments:
+    report - the name of the report, one of REPORTS
+    path - the path of the state file (brewery.STATE_FILE if omitted)
+    months - the number of months to predict for in the forecast report
+    model - the forecasting model used in the forecast report
+    """
+    if report == 'batches':
+        return iter_batches(path)
+    elif report == 'containers':
+        return iter_containers(path)
+    elif report == 'inventory':
+        return iter_inventory(path)
+    elif report == 'forecast':
+        return iter_forecast(months, model)
+    elif report == 'archive':
+        return iter_archived()
+    raise ValueError("Unknown report: %s" % report)
+
+
+def export(report: str, out, format: str = "csv", path: str = None,
+           months: int = 3, model: str = "growth") -> int:
+    """
+    Writes a report to a file and returns the number of rows written
+
+    Arguments:
+    report - the name of the report, one of REPORTS
+    out - the file to write to
+    format - 'csv' or 'jsonl'
+    path - the path of the state file (brewery.STATE_FILE if omitted)
+    months - the number of months to predict for in the forecast report
+    model - the forecasting model used in the forecast report
+    """
+    rows = get_rows(report, path, months, model)
+    if format == "csv":
+        return write_csv(rows, out, FIELDS[report])
+    elif format == "jsonl":
+        return write_jsonl(rows, out)
+    raise ValueError("Unknown format: %s" % format)
+
+
+def main(arguments: list = None) -> None:
+    """
+    Runs an export from the command line
+
+    Arguments:
+    arguments - the command line arguments (sys.argv if omitted)
+    """
+    parser = argparse.ArgumentParser(
+        description="Export brewhouse reports to CSV or JSON Lines")
+    parser.add_argument('report', choices=REPORTS + ('all',))
+    parser.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+    parser.add_argument('--output', help="file to write (default: screen)")
+    parser.add_argument('--directory',
+                        help="folder to write dated files of every report")
+    parser.add_argument('--state', help="state file to export from")
+    parser.add_argument('--months', type=int, default=3)
+    parser.add_argument('--model', default='growth')
+    options = parser.parse_args(arguments)
+    if options.report == 'all' or options.directory:
+        reports = REPORTS if options.report == 'all' else (options.report,)
+        folder = options.directory or "."
+        today = datetime.today().strftime('%Y-%m-%d')
+        for report in reports:
+            name = os.path.join(folder, "%s-%s.%s" % (
+                report, today, options.format))
+            with open(name, 'w', newline='') as out:
+                count = export(report, out, options.format, options.state,
+                               options.months, options.model)
+            print("%d rows written to %s" % (count, name))
+    elif options.output:
+        with open(options.output, 'w', newline='') as out:
+            export(options.report, out, options.format, options.state,
+                   options.months, options.model)
+    else:
+        export(options.report, sys.stdout, options.format, options.state,
+               options.months, options.model)
+
+
+if __name__ == "__main__":
+    main()
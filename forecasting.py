@@ -0,0 +1,232 @@
+"""
+This module contains the models used to forecast monthly sales, and a
+backtesting harness which measures how accurate each model has been
+on the past sales of each beer
+"""
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def growth_model(history: list, horizon: int) -> float:
+    """
+    Predicts sales using the average sale and average monthly growth
+
+    This is the original prediction method:
+    prediction = average_sale * ((1 + average_growth) ^ months)
+
+    Arguments:
+    history - list of the monthly sales, oldest month first
+    horizon - the number of months in the future to predict for
+    """
+    total_growth = 0.0
+    months = 0
+    for i in range(1, len(history)):
+        if history[i - 1]:  # months with no sales are skipped
+            total_growth += float(history[i] - history[i - 1]) / history[i - 1]
+            months += 1
+    average = float(sum(history)) / len(history)
+    if not months:
+        return average
+    return average * (1 + total_growth / months)**int(horizon)
+
+
+def exponential_model(
+        history: list,
+        horizon: int,
+        alpha: float = 0.5) -> float:
+    """
+    Predicts sales using simple exponential smoothing
+
+    Recent months are given more weight than older months, and the
+    smoothed level is used as the prediction for every future month.
+
+    Arguments:
+    history - list of the monthly sales, oldest month first
+    horizon - the number of months in the future to predict for
+    alpha - the weight given to the most recent month (0 to 1)
+    """
+    level = float(history[0])
+    for sale in history[1:]:
+        level = alpha * sale + (1 - alpha) * level
+    return level
+
+
+def seasonal_naive_model(
+        history: list,
+        horizon: int,
+        season: int = 12) -> float:
+    """
+    Predicts sales as the sales of the same month in the previous year
+
+    If there is less than a year of history, the last month is used.
+
+    Arguments:
+    history - list of the monthly sales, oldest month first
+    horizon - the number of months in the future to predict for
+    season - the number of months in one seasonal cycle
+    """
+    if len(history) < season:
+        return float(history[-1])
+    return float(history[len(history) - season + (int(horizon) - 1) % season])
+
+
+def linear_model(history: list, horizon: int) -> float:
+    """
+    Predicts sales by fitting a straight line through the monthly sales
+
+    Arguments:
+    history - list of the monthly sales, oldest month first
+    horizon - the number of months in the future to predict for
+    """
+    count = len(history)
+    if count < 2:
+        return float(history[0])
+    mean_x = (count - 1) / 2.0
+    mean_y = float(sum(history)) / count
+    covariance = 0.0
+    variance = 0.0
+    for x, y in enumerate(history):
+        covariance += (x - mean_x) * (y - mean_y)
+        variance += (x - mean_x)**2
+    slope = covariance / variance
+    prediction = mean_y + slope * (count - 1 + int(horizon) - mean_x)
+    return max(prediction, 0.0)  # sales can not be negative
+
+
+MODELS = {
+    'growth': growth_model,
+    'exponential': exponential_model,
+    'seasonal_naive': seasonal_naive_model,
+    'linear': linear_model}
+
+
+def get_model(name: str):
+    """
+    Returns the forecasting model with the given name
+
+    Arguments:
+    name - the name of the model, one of the keys of MODELS
+    """
+    if name not in MODELS:
+        raise ValueError("Unknown forecasting model: %s" % name)
+    return MODELS[name]
+
+
+def evaluate(task: tuple) -> tuple:
+    """
+    Backtests one model for one beer and horizon using rolling origins
+
+    For every month from min_train onwards the model is trained on the
+    months before it, and its prediction for horizon months later is
+    compared with what was actually sold.
+
+    Arguments:
+    task - tuple of (model name, beer, horizon, monthly sales, min_train)
+    """
+    name, beer, horizon, history, min_train = task
+    model = get_model(name)
+    errors = []
+    percentages = []
+    for origin in range(min_train, len(history) - horizon + 1):
+        predicted = model(history[:origin], horizon)
+        actual = history[origin + horizon - 1]
+        errors.append(predicted - actual)
+        if actual:  # percentage errors are undefined for zero sales
+            percentages.append(abs(predicted - actual) / actual)
+    metrics = {'count': len(errors), 'mae': None, 'rmse': None, 'mape': None,
+               'bias': None}
+    if errors:
+        metrics['mae'] = sum(abs(e) for e in errors) / len(errors)
+        metrics['rmse'] = math.sqrt(sum(e * e for e in errors) / len(errors))
+        metrics['bias'] = sum(errors) / len(errors)
+    if percentages:
+        metrics['mape'] = 100 * sum(percentages) / len(percentages)
+    return name, beer, horizon, metrics
+
+
+def backtest(
+        sales: dict,
+        models: tuple = (),
+        horizons: tuple = (1, 2, 3),
+        min_train: int = 6,
+        workers: int = None) -> dict:
+    """
+    Backtests every model for every beer and horizon in parallel
+
+    Each combination of model, beer and horizon is evaluated in a
+    separate worker process, and the error metrics (mean absolute error,
+    root mean squared error, mean absolute percentage error and bias)
+    are returned as results[beer][model][horizon].
+
+    Arguments:
+    sales - dictionary of the monthly sales of each beer, oldest month first
+    models - the names of the models to test (all models if empty)
+    horizons - the numbers of months ahead to test predictions for
+    min_train - the smallest number of months a model is trained on
+    workers - the number of worker processes (1 runs in this process, and
+              None or 0 starts one for each CPU)
+    """
+    if not workers:
+        workers = None  # ProcessPoolExecutor does not accept 0 workers
+    if not models:
+        models = tuple(MODELS)
+    for name in models:
+        get_model(name)  # unknown models rejected before starting
+    tasks = []
+    for beer, history in sales.items():
+        for name in models:
+            for horizon in horizons:
+                tasks.append((name, beer, horizon, list(history), min_train))
+    if workers == 1:
+        outcomes = map(evaluate, tasks)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        processes = workers or os.cpu_count() or 1
+        chunksize = max(1, len(tasks) // (4 * processes))
+        outcomes = executor.map(evaluate, tasks, chunksize=chunksize)
+    results = {}
+    try:
+        for name, beer, horizon, metrics in outcomes:
+            results.setdefault(beer, {}).setdefault(name, {})[horizon] = metrics
+    finally:
+        if workers != 1:
+            executor.shutdown()
+    return results
+
+
+def best_models(results: dict, horizon: int = 1, metric: str = 'mae') -> dict:
+    """
+    Chooses the most accurate model for each beer from backtest results
+
+    Arguments:
+    results - the results returned by backtest
+    horizon - the number of months ahead the model will be used for
+    metric - the error metric to compare ('mae', 'rmse' or 'mape')
+    """
+    best = {}
+    for beer, models in results.items():
+        scores = {}
+        for name, horizons in models.items():
+            score = horizons.get(horizon, {}).get(metric)
+            if score is not None:
+                scores[name] = score
+        if scores:
+            best[beer] = min(scores, key=scores.get)
+    return best
+
+
+if __name__ == "__main__":
+    import prediction
+    results = backtest(prediction.monthly_sales())
+    for beer, models in results.items():
+        print(beer)
+        for name, horizons in models.items():
+            for horizon, metrics in horizons.items():
+                print("  %-15s %d month(s): MAE %s, MAPE %s" % (
+                    name, horizon,
+                    "%.1f" % metrics['mae'] if metrics['mae'] is not None
+                    else "-",
+                    "%.1f%%" % metrics['mape'] if metrics['mape'] is not None
+                    else "-"))
+    print("Best model per beer:", best_models(results))
@@ -0,0 +1,248 @@
+"""
+This module analyses the operations log to measure how well the
+brewhouse is running: how busy each tank is, how long batches spend in
+each stage of production, how much of each beer is finished, and which
+stage is holding production up.
+"""
+import json
+import os
+import re
+from datetime import datetime
+from typing import Iterator
+
+LOG_FILE = 'logfile.log'
+STATE_FILE = 'log_analysis.json'
+LINE = re.compile(r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),\d+ (.*)$')
+CREATED = re.compile(
+    r'New batch with gyle number (\d+) created(?: \((.+), (\d+) litres\))?')
+MOVED = re.compile(r'Batch (\d+) successfully moved to the (.+?) phase'
+                   r'(?: in (\S+?))?\.')
+FINISHED = re.compile(r'Batch (\d+) successfully moved to the inventory')
+DELETED = re.compile(r'Batch (\d+) deleted')
+
+
+def new_state() -> dict:
+    """Returns the state of an analysis which has not read any of the log"""
+    return {
+        'offset': 0,
+        'first': None,
+        'last': None,
+        'open': {},
+        'stages': {},
+        'tanks': {},
+        'recipes': {},
+        'created': 0,
+        'deleted': 0}
+
+
+def read_lines(path: str, offset: int = 0) -> Iterator[tuple]:
+    """
+    Yields each complete line of the log after an offset, one at a time
+
+    Each line is yielded with the offset just after it, so the analysis
+    can carry on from there next time. A last line which has not been
+    finished yet is left for the next analysis.
+
+    Arguments:
+    path - the path of the log file
+    offset - the number of bytes of the log which have already been read
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                return  # line still being written
+            offset += len(line)
+            yield offset, line.decode('utf-8', 'replace').rstrip('\r\n')
+
+
+def parse_events(lines: Iterator[tuple]) -> Iterator[dict]:
+    """
+    Turns log lines into batch events, skipping lines about anything else
+
+    Arguments:
+    lines - iterator of (offset, line) pairs from read_lines
+    """
+    for offset, line in lines:
+        event = {'offset': offset, 'type': None}
+        match = LINE.match(line)
+        if match:
+            event['time'] = datetime.strptime(
+                match.group(1), '%Y-%m-%d %H:%M:%S').timestamp()
+            message = match.group(2)
+            created = CREATED.match(message)
+            moved = MOVED.match(message)
+            finished = FINISHED.match(message)
+            deleted = DELETED.match(message)
+            if created:
+                event.update(type='created', gyle=created.group(1),
+                             recipe=created.group(2),
+                             volume=int(created.group(3) or 0))
+            elif moved:
+                event.update(type='moved', gyle=moved.group(1),
+                             stage=moved.group(2), tank=moved.group(3))
+            elif finished:
+                event.update(type='finished', gyle=finished.group(1))
+            elif deleted:
+                event.update(type='deleted', gyle=deleted.group(1))
+        yield event  # offset kept up to date even for other lines
+
+
+def close_stage(state: dict, batch: dict, end: float, completed: bool) -> None:
+    """
+    Records the time a batch spent in its current stage and tank
+
+    Arguments:
+    state - the state of the analysis
+    batch - dictionary containing the stage, tank and start of the batch
+    end - the time the stage ended
+    completed - False if the batch was deleted part way through the stage
+    """
+    seconds = max(end - batch['since'], 0)
+    if completed:
+        stage = state['stages'].setdefault(
+            batch['stage'], {'count': 0, 'total': 0, 'max': 0})
+        stage['count'] += 1
+        stage['total'] += seconds
+        stage['max'] = max(stage['max'], seconds)
+    if batch['tank']:
+        tank = state['tanks'].setdefault(batch['tank'],
+                                         {'busy': 0, 'batches': 0})
+        tank['busy'] += seconds
+
+
+def apply_event(state: dict, event: dict) -> None:
+    """
+    Updates the running totals of the analysis with one batch event
+
+    Only the batches which are still in production are remembered, so
+    the memory used does not grow with the length of the log.
+
+    Arguments:
+    state - the state of the analysis
+    event - dictionary describing the event from parse_events
+    """
+    state['offset'] = event['offset']
+    if not event['type']:
+        return
+    if state['first'] is None:
+        state['first'] = event['time']
+    state['last'] = event['time']
+    batches = state['open']
+    gyle = event['gyle']
+    if event['type'] == 'created':
+        state['created'] += 1
+        batches[gyle] = {'stage': "hot brew", 'since': event['time'],
+                         'tank': None, 'recipe': event['recipe'],
+                         'volume': event['volume']}
+        return
+    batch = batches.get(gyle)
+    if batch:
+        close_stage(state, batch, event['time'], event['type'] != 'deleted')
+    if event['type'] == 'moved':
+        if not batch:  # batch created before the log was started
+            batch = batches[gyle] = {'recipe': None, 'volume': 0}
+        batch.update(stage=event['stage'], since=event['time'],
+                     tank=event['tank'])
+        if event['tank']:
+            state['tanks'].setdefault(
+                event['tank'], {'busy': 0, 'batches': 0})['batches'] += 1
+    elif event['type'] == 'finished':
+        recipe = (batch or {}).get('recipe') or "Unknown"
+        totals = state['recipes'].setdefault(
+            recipe, {'batches': 0, 'litres': 0})
+        totals['batches'] += 1
+        totals['litres'] += (batch or {}).get('volume', 0)
+        batches.pop(gyle, None)
+    elif event['type'] == 'deleted':
+        state['deleted'] += 1
+        batches.pop(gyle, None)
+
+
+def analyse_log(
+        path: str = LOG_FILE,
+        state_file: str = STATE_FILE,
+        reset: bool = False) -> dict:
+    """
+    Analyses the log, carrying on from where the last analysis stopped
+
+    The log is read in a single pass through a pipeline of generators,
+    and the state of the analysis (including how far through the log it
+    got) is saved so the next analysis only reads new lines. If the log
+    has been cleared or replaced since, it is analysed from the start.
+
+    Arguments:
+    path - the path of the log file
+    state_file - the file the state of the analysis is saved in
+    reset - True to ignore the saved state and analyse the whole log
+    """
+    state = new_state()
+    if not reset and state_file and os.path.exists(state_file):
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+    if os.path.getsize(path) < state['offset']:  # log has been replaced
+        state = new_state()
+    for event in parse_events(read_lines(path, state['offset'])):
+        apply_event(state, event)
+    if state_file:
+        with open(state_file, 'w') as f:
+            json.dump(state, f)
+    return state
+
+
+def report(state: dict) -> dict:
+    """
+    Summarises the analysis into utilization, cycle times and throughput
+
+    Tank utilization is the share of the logged period each tank was in
+    use, counting batches still in a tank up to the last logged event.
+    The bottleneck is the stage with the longest average cycle time.
+
+    Arguments:
+    state - the state of the analysis from analyse_log
+    """
+    period = 0
+    if state['first'] is not None:
+        period = state['last'] - state['first']
+    busy = {tank: info['busy'] for tank, info in state['tanks'].items()}
+    for batch in state['open'].values():
+        if batch.get('tank'):  # batches still in a tank counted so far
+            busy[batch['tank']] = (busy.get(batch['tank'], 0)
+                                   + max(state['last'] - batch['since'], 0))
+    utilization = {}
+    for tank, seconds in busy.items():
+        utilization[tank] = round(seconds / period, 3) if period else 0.0
+    cycle_times = {}
+    for stage, info in state['stages'].items():
+        cycle_times[stage] = {
+            'batches': info['count'],
+            'average_hours': round(info['total'] / info['count'] / 3600, 2),
+            'max_hours': round(info['max'] / 3600, 2)}
+    weeks = period / (7 * 24 * 3600)
+    throughput = {}
+    for recipe, info in state['recipes'].items():
+        throughput[recipe] = dict(info)
+        throughput[recipe]['litres_per_week'] = (
+            round(info['litres'] / weeks, 1) if weeks else 0.0)
+    in_progress = {}
+    for batch in state['open'].values():
+        in_progress[batch['stage']] = in_progress.get(batch['stage'], 0) + 1
+    bottleneck = None
+    if cycle_times:
+        bottleneck = max(cycle_times,
+                         key=lambda k: cycle_times[k]['average_hours'])
+    return {
+        'utilization': dict(sorted(utilization.items(),
+                                   key=lambda item: -item[1])),
+        'cycle_times': cycle_times,
+        'throughput': throughput,
+        'in_progress': in_progress,
+        'bottleneck': bottleneck,
+        'created': state['created'],
+        'deleted': state['deleted']}
+
+
+if __name__ == "__main__":
+    import sys
+    summary = report(analyse_log(reset="--reset" in sys.argv))
+    print(json.dumps(summary, indent=2))
@@ -3,32 +3,41 @@ This module is a program that manages processes in a brewhouse
 with a basic user interface
 """
 import time
+import json
 import logging
+import os
+import queue
+import threading
 from datetime import datetime
 from typing import Tuple
 from tkinter import *
 from tkinter import ttk
 from tkinter import messagebox
-from tkinter.scrolledtext import ScrolledText
 from tkinter.font import Font
 import brewery
+import planner
 import prediction
+import telemetry
 
 beers = ("Organic Pilsner", "Organic Dunkel", "Organic Red Helles")
+states = ("hot brew", "fermentation", "conditioning", "bottling")
+# rows of the production batch list, and the canvas items of the rows drawn
+BATCH_VIEW = {'rows': {}, 'order': [], 'drawn': {}, 'row_height': 80}
+SNAPSHOT_FILE = 'dashboard_snapshot.json'
 logging.basicConfig(filename='logfile.log', level=logging.DEBUG,
                     format='%(asctime)s %(message)s')
 
 
-def planning_algorithm() -> None:
+def plan_next_brew() -> dict:
     """
-    Finds the most appropriate beer to brew next and prints it
+    Finds the most appropriate beer to brew next
 
-    This subroutine finds the most appropriate beer by considering
+    This function finds the most appropriate beer by considering
     the current inventory of beers, and the batches currently inside
     the tanks. It calculates using the predictions which beer will
     run out of stock first, and on which month. If all of the equipment
-    is in use, the function will not make a prediction until a tank is
-    empty.
+    is in use, the next batch from the brewing plan is given instead.
+    No part of the form is used, so this can run in the background.
     """
     found = False
     months = 1
@@ -54,33 +63,61 @@ def planning_algorithm() -> None:
         beer = 'Organic Pilsner'
     elif index_of_beer == 2:
         beer = 'Organic Dunkel'
+    plan = {
+        'beer': beer,
+        'months': months,
+        'stock': int(production_totals[index_of_beer]),
+        'sale': int(predictions[beer]['prediction']),
+        'next': None}
     # checks to see if there are available tanks
-    availability = brewery.check_equipment_availability()
-    if availability:  # if tanks are available
+    plan['available'] = brewery.check_equipment_availability()
+    if not plan['available']:
+        schedule = planner.plan_brews()['schedule']
+        if schedule:  # next batch from the brewing plan
+            plan['next'] = schedule[0]
+    return plan
+
+
+def draw_planning(plan: dict) -> None:
+    """
+    Prints the recommendation of which beer to brew next
+
+    Arguments:
+    plan - dictionary containing the recommendation from plan_next_brew
+    """
+    for widget in PLANNING_FRAME.winfo_children():
+        widget.destroy()  # previous recommendation cleared
+    if plan['available']:  # if tanks are available
         planning_prediction = Label(PLANNING_FRAME,
             text="%s is the best choice based on\nthe current demand,\
-stock and batches in production." % (beer))
+stock and batches in production." % (plan['beer']))
         planning_prediction.grid(row=0, column=0)  # labels created and placed
         stock_label = Label(PLANNING_FRAME, text="You have enough \
-stock to last for %d month(s)" % months)
+stock to last for %d month(s)" % plan['months'])
         stock_label.grid(row=1, column=0)  # recommendation printed
         prediction_label = Label(PLANNING_FRAME, text="In month %d you \
 should only have %d bottles" %
-                        (months, int(production_totals[index_of_beer])))
+                        (plan['months'], plan['stock']))
         prediction_label.grid(row=2, column=0)
-        month_sale = int(predictions[beer]['prediction'])
         label_sale = Label(
             PLANNING_FRAME, text="In month %d you are expected to sell %d bottles" %
-            (months, month_sale))
+            (plan['months'], plan['sale']))
         label_sale.grid(row=3, column=0)
         logging.info(
             "%s recommended as the most viable beer to produce" %
-            beer)
+            plan['beer'])
     else:
         planning_prediction = Label(
             PLANNING_FRAME,
             text="There are no available facilities to start a new batch right now.")
         planning_prediction.grid(row=0, column=0)
+        schedule = plan['next']
+        if schedule:  # next batch from the brewing plan shown instead
+            next_label = Label(PLANNING_FRAME, text="Next planned: %s, %d \
+litres in %s\nstarting on %s" % (schedule['recipe'], schedule['volume'],
+                                  schedule['fermenter'].capitalize(),
+                                  schedule['start']))
+            next_label.grid(row=1, column=0)
 
 
 def update_predictions() -> None:
@@ -118,14 +155,14 @@ def find_most_understocked_beer(predictions: dict, totals: list) -> Tuple:
 
 def sum_all_beers() -> dict:
     """Calculates the total bottles of each beer in the inventory"""
-    data = brewery.read_data('inventory')  # inventory data read in
+    totals = brewery.get_totals()  # bottled and in production totals read in
     total_bottles = {
         'Organic Red Helles': 0,
         'Organic Pilsner': 0,
         'Organic Dunkel': 0}
-    for key, batchdata in data.items():
-        bottles = batchdata['volume'] // 0.5  # number of bottles calculated
-        total_bottles[batchdata['recipe']] += bottles  # bottles added to list
+    for section in ('bottled', 'production'):
+        for recipe, bottles in totals[section].items():
+            total_bottles[recipe] += bottles  # bottles added to list
     return total_bottles
 
 
@@ -155,12 +192,20 @@ def create_new_batch() -> None:
                 "volume": volume,
                 "recipe": recipe
             }}
-            brewery.add_brew(next_batch)  # batch written to file
+            try:
+                brewery.add_brew(next_batch)  # batch written to file
+            except (brewery.ConflictError, ValueError) as error:
+                messagebox.showerror(
+                    "Error", "The batch could not be saved: %s" % error)
+                logging.error("ERROR Batch %d could not be saved: %s" %
+                              (gyle, error))
+                return
             messagebox.showinfo(
                 "Add brew",
                 "New batch added to the hot brew stage successfully.")
             display_batches()  # batches updated on screen
-            logging.info("New batch with gyle number %d created" % gyle)
+            logging.info("New batch with gyle number %d created (%s, %d litres)"
+                         % (gyle, recipe, volume))
         else:
             messagebox.showerror(
                 "Error",
@@ -181,26 +226,21 @@ def calculate_gyle_number() -> int:
     """
     Calculates a new unique gyle number for the next batch to be produced
 
-    Reads through the list of sold batches and batches currently in
-    production and finds the highest past gyle number, and adds 1 to it
-    to create a new unique gyle number.
+    Reads through the list of sold batches, the batches currently in the
+    inventory and the highest archived gyle number, and finds the highest
+    past gyle number, and adds 1 to it to create a new unique gyle number.
     """
     orders = prediction.csv_read()  # reads in list of all past orders
-    highest_gyle = 0
-    def list_sort(k): return int(k['Gyle Number'])  # sorts list by gyle no.
     # highest gyle number from the past orders chosen
-    gyle = sorted(orders, key=list_sort)[-1]['Gyle Number']
-    current_batches = brewery.read_data("inventory")
-    if current_batches:
-        for batch in current_batches:  # highest gyle from stock chosen
-            if int(current_batches[batch]['gyle']) > highest_gyle:
-                highest_gyle = int(current_batches[batch]['gyle'])
-    if int(gyle) > highest_gyle:  # highest gyle found
-        highest_gyle = gyle
-    return int(highest_gyle) + 1  # new gyle number created
+    highest_gyle = max([int(order['Gyle Number']) for order in orders] + [0])
+    data = brewery.read_data()
+    for batch in data['inventory'].values():  # highest gyle from stock chosen
+        highest_gyle = max(highest_gyle, int(batch['gyle']))
+    highest_gyle = max(highest_gyle, brewery.get_archived(data)['max_gyle'])
+    return highest_gyle + 1  # new gyle number created
 
 
-def draw_predictions(timeframe: int = 1) -> None:
+def draw_predictions(timeframe: int = 1, result: list = None) -> None:
     """
     Draws out the prediction table with headers and prefilled data
 
@@ -211,9 +251,13 @@ def draw_predictions(timeframe: int = 1) -> None:
 
     Arguments:
     timeframe - the number of months in the future to predict for (default 1)
+    result - the ratio and predictions, if already calculated (optional)
     """
-    ratio, predictions = prediction.growth_rate(timeframe)
-    # predictions calculated
+    if result:
+        ratio, predictions = result
+    else:
+        ratio, predictions = prediction.growth_rate(timeframe)
+        # predictions calculated
     i = 2
     for key, value in predictions.items():  # rows
         b = Entry(LABELFRAME)  # vertical headers drawn
@@ -268,20 +312,27 @@ def display_inventory(event="") -> None:
         i += 1
 
 
-def display_containers(event="") -> None:
+def display_containers(event="", info: dict = None) -> None:
     """
     Displays information about the currently selected container
 
     Each container is listed on the left side of the screen.
     Next to the list is information about the currently selected
     tank. By default, the information for 'albert' is displayed.
+
+    Arguments:
+    event - the list selection event (omitted for the default container)
+    info - the information about the container, if already fetched
     """
     try:
         if not event:
             container = "albert"  # by default 'albert' is displayed
         else:
             container = CONTAINER_LIST.get(CONTAINER_LIST.curselection())
-        containers = brewery.get_container(container)  # container data
+        if info:
+            containers = dict(info)
+        else:
+            containers = brewery.get_container(container)  # container data
         string = ""
         containers['Volume'] += " litres"
         for key, value in containers.items():  # container data printed to form
@@ -315,24 +366,128 @@ def display_container_data(event="") -> None:
     CONTAINER_DATA.config(text=string)
 
 
-def display_batches() -> None:
-    """Displays the list of all batches in production and data about them"""
-    BATCHES.config(state="normal")
-    strings = brewery.get_production_batches()
-    BATCHES.delete('1.0', END)
-    i = 1.0
-    j = 1
-    for batch in strings:
-        BATCHES.insert(INSERT, batch)  # current batches displayed
-        BATCHES.tag_add(str(i), i, i + 6)
-        if j % 2 == 0:
-            BATCHES.tag_config(str(i), background="#E0E0E0")
+def display_batches(rows: dict = None) -> None:
+    """
+    Displays the list of all batches in production and data about them
+
+    The new rows are compared with the rows already in the list, and
+    only the rows which have changed are redrawn. The whole list is only
+    laid out again when batches are added, removed or move in or out of
+    the selected filter.
+
+    Arguments:
+    rows - the rows of the batches in production, if already fetched
+    """
+    if rows is None:
+        rows = brewery.get_production_rows()
+    old_rows = BATCH_VIEW['rows']
+    BATCH_VIEW['rows'] = rows
+    changed = [gyle for gyle, row in rows.items() if old_rows.get(gyle) != row]
+    relayout = rows.keys() != old_rows.keys()  # batches added or removed
+    for gyle in changed:
+        if gyle in old_rows and (batch_matches_filter(old_rows[gyle])
+                                 != batch_matches_filter(rows[gyle])):
+            relayout = True  # batch moved in or out of the filter
+    if relayout:
+        order_batches()
+    else:
+        for gyle in changed:
+            if gyle in BATCH_VIEW['drawn']:  # only rows on screen redrawn
+                BATCHES.itemconfig(
+                    BATCH_VIEW['drawn'][gyle][1],
+                    text=brewery.format_production_batch(rows[gyle]))
+
+
+def batch_matches_filter(row: dict) -> bool:
+    """
+    Checks if a batch matches the state and recipe chosen to filter by
+
+    Arguments:
+    row - dictionary containing the information about the batch
+    """
+    state = STATE_FILTER.get()
+    recipe = RECIPE_FILTER.get()
+    if state in states and row['state'] != state:
+        return False
+    if recipe in beers and row['recipe'] != recipe:
+        return False
+    return True
+
+
+def filter_batches(event="") -> None:
+    """Shows only the batches matching the chosen state and recipe"""
+    BATCHES.yview_moveto(0)  # filtered list shown from the top
+    order_batches()
+
+
+def order_batches() -> None:
+    """
+    Works out which batches are listed and in what order, then draws them
+
+    Only the positions of the rows are worked out here; the rows
+    themselves are drawn by draw_visible_batches when they can be seen.
+    """
+    BATCH_VIEW['order'] = [gyle for gyle, row in BATCH_VIEW['rows'].items()
+                           if batch_matches_filter(row)]
+    for items in BATCH_VIEW['drawn'].values():
+        BATCHES.delete(*items)  # positions of drawn rows may have changed
+    BATCH_VIEW['drawn'] = {}
+    height = BATCH_VIEW['row_height'] * len(BATCH_VIEW['order'])
+    BATCHES.config(scrollregion=(0, 0, 0, height))
+    draw_visible_batches()
+
+
+def draw_visible_batches(event="") -> None:
+    """
+    Draws the rows of the batch list which can currently be seen
+
+    Rows which have scrolled out of view are removed from the canvas,
+    so the number of rows drawn stays the same however many batches
+    there are.
+    """
+    order = BATCH_VIEW['order']
+    drawn = BATCH_VIEW['drawn']
+    row_height = BATCH_VIEW['row_height']
+    top = BATCHES.canvasy(0)
+    bottom = top + max(BATCHES.winfo_height(), row_height)
+    first = max(0, int(top // row_height))
+    last = min(len(order), int(bottom // row_height) + 1)
+    visible = set(order[first:last])
+    for gyle in list(drawn):
+        if gyle not in visible:  # row scrolled out of view
+            BATCHES.delete(*drawn.pop(gyle))
+    width = max(BATCHES.winfo_width(), 400)
+    for i in range(first, last):
+        gyle = order[i]
+        if gyle in drawn:
+            continue
+        if i % 2 == 1:
+            colour = "#E0E0E0"
             # background colour changed to make it easier to read
         else:
-            BATCHES.tag_config(str(i), background="white")
-        i += 6.0
-        j += 1
-    BATCHES.config(state="disabled")
+            colour = "white"
+        background = BATCHES.create_rectangle(
+            0, i * row_height, width, (i + 1) * row_height,
+            fill=colour, outline="")
+        text = BATCHES.create_text(
+            4, i * row_height + 2, anchor="nw", font=BATCH_FONT,
+            text=brewery.format_production_batch(BATCH_VIEW['rows'][gyle]))
+        drawn[gyle] = (background, text)
+
+
+def scroll_batches(*args) -> None:
+    """Scrolls the batch list and draws the rows which come into view"""
+    BATCHES.yview(*args)
+    draw_visible_batches()
+
+
+def wheel_batches(event) -> None:
+    """Scrolls the batch list with the mouse wheel"""
+    if event.num == 4 or event.delta > 0:
+        BATCHES.yview_scroll(-1, "units")
+    else:
+        BATCHES.yview_scroll(1, "units")
+    draw_visible_batches()
 
 
 def remove_batch() -> None:
@@ -349,7 +504,14 @@ def remove_batch() -> None:
                 'Delete Batch', 'Are you sure you want to delete the batch number %s?' %
                 gyle_number, icon='warning')
             if MsgBox == 'yes':  # if the user selects 'yes' from the prompt
-                brewery.delete_batch(gyle_number)  # batch removed from file
+                try:
+                    brewery.delete_batch(gyle_number)  # batch removed
+                except (brewery.ConflictError, ValueError) as error:
+                    messagebox.showerror(
+                        "Error", "The batch could not be deleted: %s" % error)
+                    logging.error("ERROR Batch %d could not be deleted: %s" %
+                                  (gyle_number, error))
+                    return
                 display_batches()  # batches refreshed
                 messagebox.showinfo(
                     "Delete Batch", "Batch successfully deleted.")
@@ -399,11 +561,18 @@ def save_state() -> None:
         logging.info(
             "Batch %d successfully moved to the inventory." %
             gyleNumber)
-    brewery.update_containers(
-        batch_data,
-        finish_time,
-        state,
-        container.lower())
+    try:
+        brewery.update_containers(
+            batch_data,
+            finish_time,
+            state,
+            container.lower())
+    except (brewery.ConflictError, ValueError) as error:
+        messagebox.showerror(
+            "Error", "The batch could not be moved: %s" % error)
+        logging.error("ERROR Batch %d could not be moved: %s" %
+                      (gyleNumber, error))
+        return
     display_batches()  # batches refreshed
     POSSIBLE_CONTAINER_LIST.delete(0, END)  # clear possible container list
     CONTAINER_DATA.config(text="")
@@ -411,9 +580,14 @@ def save_state() -> None:
     messagebox.showinfo(
         "Success", "Batch %d successfully moved to the %s phase." %
         (gyleNumber, state))
-    logging.info(
-        "Batch %d successfully moved to the %s phase." %
-        (gyleNumber, state))
+    if container.lower() == "bottling":
+        logging.info(
+            "Batch %d successfully moved to the %s phase." %
+            (gyleNumber, state))
+    else:  # tank recorded for the log analysis
+        logging.info(
+            "Batch %d successfully moved to the %s phase in %s." %
+            (gyleNumber, state, container.lower()))
 
 
 def update() -> None:
@@ -462,11 +636,18 @@ def update() -> None:
                 gyleNumber,
                 icon='warning')
             if MsgBox == 'yes':
-                brewery.add_batch_to_inventory(batch_data)  # add to stock
+                try:
+                    brewery.add_batch_to_inventory(batch_data)  # add to stock
+                except (brewery.ConflictError, ValueError) as error:
+                    messagebox.showerror(
+                        "Error", "The batch could not be moved: %s" % error)
+                    logging.error("ERROR Batch %d could not be moved: %s" %
+                                  (gyleNumber, error))
+                    return
                 display_batches()  # refresh inventory
                 logging.info(
                     "Batch %d successfully moved to the inventory." %
-                    (gyleNumber, state))
+                    gyleNumber)
         if batch_data['state'] in ("fermentation", "hot brew"):
             if containers:
                 for key, value in containers.items():
@@ -483,9 +664,115 @@ def update() -> None:
         logging.error("ERROR User entered wrong gyle number")
 
 
+def compute_dashboard() -> dict:
+    """
+    Calculates everything shown on the form when it starts
+
+    The fingerprints of the state file and the sales data are taken
+    first, so the snapshot records which data it was calculated from.
+    No part of the form is used, so this can run in the background.
+    """
+    snapshot = {
+        'state': list(brewery.state_fingerprint()),
+        'sales': list(prediction.dataset_fingerprint())}
+    snapshot['predictions'] = list(prediction.growth_rate(1))
+    snapshot['plan'] = plan_next_brew()
+    snapshot['rows'] = brewery.get_production_rows()
+    snapshot['container'] = brewery.get_container("albert")
+    return snapshot
+
+
+def paint_dashboard(snapshot: dict) -> None:
+    """
+    Draws the predictions, container, batches and recommendation
+
+    Arguments:
+    snapshot - dictionary of everything shown, from compute_dashboard
+    """
+    draw_predictions(1, snapshot['predictions'])
+    display_containers(info=snapshot['container'])
+    display_batches(snapshot['rows'])
+    draw_planning(snapshot['plan'])
+
+
+def load_snapshot() -> dict:
+    """Reads the dashboard snapshot saved last time, if there is one"""
+    try:
+        with open(SNAPSHOT_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_snapshot(snapshot: dict) -> None:
+    """
+    Saves the dashboard snapshot so the next start can draw it at once
+
+    Arguments:
+    snapshot - dictionary of everything shown, from compute_dashboard
+    """
+    temporary = SNAPSHOT_FILE + ".tmp"
+    try:
+        with open(temporary, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(temporary, SNAPSHOT_FILE)
+    except OSError:
+        logging.warning("WARNING Dashboard snapshot could not be saved")
+
+
+def revalidate_dashboard(snapshot: dict) -> None:
+    """
+    Checks the snapshot drawn at startup is still up to date
+
+    If config.json or the sales data have changed since the snapshot
+    was saved, everything is recalculated in a background thread and
+    drawn once it is ready. Otherwise only the batch list is refreshed,
+    as the time remaining for each batch will have changed.
+
+    Arguments:
+    snapshot - the snapshot drawn when the form started
+    """
+    if (snapshot.get('state') == list(brewery.state_fingerprint())
+            and snapshot.get('sales') == list(prediction.dataset_fingerprint())):
+        display_batches()
+        return
+    results = queue.Queue()
+
+    def calculate():
+        try:
+            results.put(compute_dashboard())
+        except Exception as error:
+            results.put(error)
+    threading.Thread(target=calculate, daemon=True).start()
+    WINDOW.after(100, finish_revalidation, results)
+
+
+def finish_revalidation(results: queue.Queue) -> None:
+    """
+    Draws the recalculated dashboard once the background thread is done
+
+    The batches are read again first, as they may have been added, moved
+    or deleted on the form while the dashboard was being recalculated.
+
+    Arguments:
+    results - queue the background thread puts the new snapshot in
+    """
+    try:
+        snapshot = results.get_nowait()
+    except queue.Empty:
+        WINDOW.after(100, finish_revalidation, results)  # check again later
+        return
+    if isinstance(snapshot, Exception):
+        logging.error("ERROR Dashboard could not be recalculated: %s" %
+                      snapshot)
+        return
+    snapshot['rows'] = brewery.get_production_rows()  # latest batches
+    paint_dashboard(snapshot)
+    save_snapshot(snapshot)
+
+
 if __name__ == "__main__":
     containers = {}
-    prediction.csv_read()
     WINDOW = Tk()
     WINDOW.title("Barnaby's Brewhouse")  # form drawn
     WINDOW.geometry("+0+0")
@@ -504,7 +791,6 @@ if __name__ == "__main__":
         text="Calculate",
         command=update_predictions)
     ACCEPTBUTTON.grid(row=0, column=2, columnspan=1, pady=5)
-    draw_predictions()
 
     # draws the 'add a batch' and 'display inventory' section
     BATCH_TABS = ttk.Notebook(WINDOW)
@@ -574,7 +860,6 @@ if __name__ == "__main__":
     CONTAINER_LABEL = ttk.Label(CONTAINER_FRAME, text="")
     CONTAINER_LABEL.grid(row=0, column=1, padx=10, pady=10, sticky="NSEW")
     CONTAINER_FRAME.grid_propagate(0)
-    display_containers()
 
     # current production batches section drawn
     BATCH_FRAME = LabelFrame(
@@ -594,10 +879,25 @@ if __name__ == "__main__":
     BATCH_FRAME.columnconfigure(0, weight=1)
     BATCH_FRAME.rowconfigure(0, weight=1)
     BATCH_FRAME.grid_propagate(0)
-    BATCHES = ScrolledText(BATCH_FRAME)
-    BATCHES.grid(row=0, column=0, columnspan=5)
-    BATCHES['font'] = Font(family="Helvetica", size=8, weight="bold")
-    display_batches()
+    BATCH_FONT = Font(family="Helvetica", size=8, weight="bold")
+    BATCH_VIEW['row_height'] = BATCH_FONT.metrics("linespace") * 6 + 4
+    BATCHES = Canvas(
+        BATCH_FRAME,
+        background="white",
+        highlightthickness=0,
+        height=60,
+        yscrollincrement=BATCH_FONT.metrics("linespace"))
+    BATCHES.grid(row=0, column=0, columnspan=4, sticky="NSEW")
+    BATCH_SCROLL = ttk.Scrollbar(
+        BATCH_FRAME,
+        orient=VERTICAL,
+        command=scroll_batches)
+    BATCH_SCROLL.grid(row=0, column=4, sticky="NS")
+    BATCHES.config(yscrollcommand=BATCH_SCROLL.set)
+    BATCHES.bind("<Configure>", draw_visible_batches)
+    BATCHES.bind("<MouseWheel>", wheel_batches)
+    BATCHES.bind("<Button-4>", wheel_batches)
+    BATCHES.bind("<Button-5>", wheel_batches)
     LBLGYLE = Label(BATCH_FRAME, text="Enter gyle number: ")
     LBLGYLE.grid(row=1, column=0, sticky="W")
     gyle = Entry(BATCH_FRAME)
@@ -606,6 +906,22 @@ if __name__ == "__main__":
     UPDATEBUTTON.grid(row=1, column=2, columnspan=1, padx=1)
     DELETE_BUTTON = Button(BATCH_FRAME, text="Delete", command=remove_batch)
     DELETE_BUTTON.grid(row=1, column=3, columnspan=1)
+    STATE_FILTER = ttk.Combobox(
+        BATCH_FRAME,
+        values=("All states",) + states,
+        state="readonly",
+        width=12)
+    STATE_FILTER.set("All states")
+    STATE_FILTER.grid(row=2, column=0, sticky="W")
+    STATE_FILTER.bind("<<ComboboxSelected>>", filter_batches)
+    RECIPE_FILTER = ttk.Combobox(
+        BATCH_FRAME,
+        values=("All recipes",) + beers,
+        state="readonly",
+        width=18)
+    RECIPE_FILTER.set("All recipes")
+    RECIPE_FILTER.grid(row=2, column=1, columnspan=3, sticky="W")
+    RECIPE_FILTER.bind("<<ComboboxSelected>>", filter_batches)
 
     # move current batches to next production stage section drawn
     gyleNumber = 0
@@ -651,6 +967,14 @@ if __name__ == "__main__":
         height=120)
     PLANNING_FRAME.grid(row=10, column=0, padx=5, pady=5, sticky="NWE")
     PLANNING_FRAME.grid_propagate(0)
-    planning_algorithm()
+    telemetry.start_feed()  # tank readings collected in the background
+    snapshot = load_snapshot()
+    if snapshot:  # last dashboard drawn at once, then checked
+        paint_dashboard(snapshot)
+        WINDOW.after(100, revalidate_dashboard, snapshot)
+    else:
+        snapshot = compute_dashboard()
+        paint_dashboard(snapshot)
+        save_snapshot(snapshot)
     WINDOW.resizable(width=False, height=False)  # form is a fixed size
     WINDOW.mainloop()  # form loaded
@@ -0,0 +1,181 @@
+"""
+This module contains compact models of the batches and containers.
+
+Volumes are held as whole millilitres, so bottle counts and volume
+comparisons are worked out with integers instead of dividing litres
+by 0.5. The models use __slots__, and BatchColumns keeps the columns
+of many batches which the inventory totals are scanned from in typed
+arrays, so a scan of a large inventory works on arrays of integers.
+"""
+from array import array
+
+BOTTLE_ML = 500  # each bottle is half a litre
+STATES = ('hot brew', 'fermentation', 'conditioning', 'bottling', 'bottled')
+
+
+def litres_to_ml(volume) -> int:
+    """
+    Converts a volume in litres to whole millilitres
+
+    Arguments:
+    volume - the volume in litres
+    """
+    return int(round(volume * 1000))
+
+
+def ml_to_litres(volume_ml: int):
+    """
+    Converts a volume in millilitres to litres, as a whole number if it is one
+
+    Arguments:
+    volume_ml - the volume in millilitres
+    """
+    if volume_ml % 1000 == 0:
+        return volume_ml // 1000
+    return volume_ml / 1000
+
+
+class Batch:
+    """A batch of beer, with its volume in millilitres"""
+    __slots__ = ('gyle', 'id', 'state', 'volume_ml', 'recipe')
+
+    def __init__(self, gyle: int, id: int, state: str, volume_ml: int,
+                 recipe: str):
+        self.gyle = gyle
+        self.id = id
+        self.state = state
+        self.volume_ml = volume_ml
+        self.recipe = recipe
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Batch':
+        """
+        Creates a batch from its dictionary in the state file
+
+        Arguments:
+        data - dictionary containing the batch data (volume in litres)
+        """
+        return cls(int(data['gyle']), data['id'], data['state'],
+                   litres_to_ml(data['volume']), data['recipe'])
+
+    def to_dict(self) -> dict:
+        """Returns the batch as a dictionary for the state file"""
+        return {
+            'id': self.id,
+            'gyle': self.gyle,
+            'state': self.state,
+            'volume': ml_to_litres(self.volume_ml),
+            'recipe': self.recipe}
+
+    @property
+    def bottles(self) -> int:
+        """The number of 500ml bottles the batch fills"""
+        return self.volume_ml // BOTTLE_ML
+
+    @property
+    def bottled(self) -> bool:
+        """True if the batch has finished production"""
+        return self.id == -1
+
+
+class Container:
+    """A tank which batches are fermented or conditioned in"""
+    __slots__ = ('name', 'id', 'volume_ml', 'fermenter', 'conditioner',
+                 'occupied', 'finish')
+
+    def __init__(self, name: str, id: int, volume_ml: int, fermenter: bool,
+                 conditioner: bool, occupied: bool, finish: str):
+        self.name = name
+        self.id = id
+        self.volume_ml = volume_ml
+        self.fermenter = fermenter
+        self.conditioner = conditioner
+        self.occupied = occupied
+        self.finish = finish
+
+    @classmethod
+    def from_dict(cls, name: str, data: dict) -> 'Container':
+        """
+        Creates a container from its dictionary in the state file
+
+        Arguments:
+        name - the name of the container
+        data - dictionary containing the container data (volume in litres)
+        """
+        return cls(name, data['id'], litres_to_ml(data['volume']),
+                   data['fermenter'], data['conditioner'], data['occupied'],
+                   data['finish'])
+
+    def can_hold(self, volume_ml: int) -> bool:
+        """
+        Checks if a batch fits in the container
+
+        Arguments:
+        volume_ml - the volume of the batch in millilitres
+        """
+        return self.volume_ml >= volume_ml
+
+    def describe(self) -> dict:
+        """Returns the volume and capabilities of the container as text"""
+        return {
+            'Volume': str(ml_to_litres(self.volume_ml)),
+            'Fermenter': ("No", "Yes")[self.fermenter],
+            'Conditioner': ("No", "Yes")[self.conditioner]}
+
+
+class BatchColumns:
+    """
+    The container, volume and recipe of many batches as typed arrays
+
+    Recipes are stored as small codes which index into a list of names,
+    so each batch takes a few bytes rather than a dictionary.
+    """
+    __slots__ = ('ids', 'volumes', 'recipes', 'recipe_names')
+
+    def __init__(self):
+        self.ids = array('i')
+        self.volumes = array('q')  # millilitres
+        self.recipes = array('H')
+        self.recipe_names = []
+
+    @classmethod
+    def from_inventory(cls, inventory: dict) -> 'BatchColumns':
+        """
+        Creates the columns from the inventory in the state file
+
+        The arrays are filled straight from the batch dictionaries, so no
+        object is made for each batch.
+
+        Arguments:
+        inventory - dictionary of batch data keyed by gyle number
+        """
+        columns = cls()
+        batches = inventory.values()
+        codes = {}  # code of each recipe name, in order of appearance
+        columns.recipes = array('H', [
+            codes.setdefault(batchdata['recipe'], len(codes))
+            for batchdata in batches])
+        columns.recipe_names = list(codes)
+        columns.ids = array('i', [batchdata['id'] for batchdata in batches])
+        columns.volumes = array('q', [litres_to_ml(batchdata['volume'])
+                                      for batchdata in batches])
+        return columns
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def bottle_totals(self) -> dict:
+        """
+        Returns the bottles of each beer, bottled and still in production
+        """
+        bottled = [0] * len(self.recipe_names)
+        production = [0] * len(self.recipe_names)
+        for id, volume, recipe in zip(self.ids, self.volumes, self.recipes):
+            if id == -1:
+                bottled[recipe] += volume // BOTTLE_ML
+            else:
+                production[recipe] += volume // BOTTLE_ML
+        return {
+            'bottled': dict(zip(self.recipe_names, bottled)),
+            'production': dict(zip(self.recipe_names, production))}
+
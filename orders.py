@@ -0,0 +1,155 @@
+"""
+This module answers queries over the history of past orders, such as
+the orders of one beer for one customer between two dates, without
+scanning every order
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import Iterator
+import prediction
+import rollups
+
+_index = {'fingerprint': None, 'data': None}
+
+
+def build_index(orders: list) -> dict:
+    """
+    Indexes the past orders by date, recipe and customer
+
+    The orders are kept in date order with a matching sorted list of
+    dates, so date ranges can be found with a binary search. Each recipe
+    and customer has a posting list of the positions of its orders,
+    which are also in date order.
+
+    Arguments:
+    orders - list of dictionaries containing the past orders, sorted by date
+    """
+    parsed = {}  # each distinct date is only parsed once
+    dates = []
+    recipes = {}
+    customers = {}
+    for position, order in enumerate(orders):
+        day = order['Date Required']
+        if day not in parsed:
+            parsed[day] = datetime.strptime(day, '%d-%b-%y').toordinal()
+        dates.append(parsed[day])
+        recipes.setdefault(order['Recipe'], []).append(position)
+        customers.setdefault(order['Customer'], []).append(position)
+    return {
+        'orders': orders,
+        'dates': dates,
+        'recipes': recipes,
+        'customers': customers}
+
+
+def get_index() -> dict:
+    """Returns the order index, rebuilding it if the sales data changed"""
+    fingerprint = prediction.dataset_fingerprint()
+    if _index['fingerprint'] != fingerprint:
+        _index['data'] = build_index(prediction.csv_read())
+        _index['fingerprint'] = fingerprint
+    return _index['data']
+
+
+def to_ordinal(day) -> int:
+    """
+    Converts a date, datetime or 'YYYY-MM-DD' string to a day number
+
+    Arguments:
+    day - the date to convert
+    """
+    if isinstance(day, str):
+        day = datetime.strptime(day, '%Y-%m-%d')
+    if isinstance(day, datetime):
+        day = day.date()
+    if not isinstance(day, date):
+        raise ValueError("Dates must be dates or 'YYYY-MM-DD' strings")
+    return day.toordinal()
+
+
+def query_orders(
+        start=None,
+        end=None,
+        recipe: str = "",
+        customer: str = "") -> Iterator[dict]:
+    """
+    Returns an iterator over the orders matching a query, in date order
+
+    The date range is found with a binary search of the sorted dates.
+    If a recipe or customer is given, only the shorter of their posting
+    lists is walked, and the other condition is checked order by order.
+    Orders are produced one at a time, so large results are never held
+    in a list.
+
+    Arguments:
+    start - the first date to include (optional)
+    end - the last date to include (optional)
+    recipe - only include orders of this beer (optional)
+    customer - only include orders from this customer (optional)
+    """
+    index = get_index()
+    low = 0
+    high = len(index['dates'])
+    if start is not None:
+        low = bisect_left(index['dates'], to_ordinal(start))
+    if end is not None:
+        high = bisect_right(index['dates'], to_ordinal(end))
+    postings = []
+    if recipe:
+        postings.append(index['recipes'].get(recipe, []))
+    if customer:
+        postings.append(index['customers'].get(customer, []))
+    return _matching_orders(index, low, high, postings, recipe, customer)
+
+
+def _matching_orders(
+        index: dict,
+        low: int,
+        high: int,
+        postings: list,
+        recipe: str,
+        customer: str) -> Iterator[dict]:
+    """Yields the orders between two positions which match the query"""
+    orders = index['orders']
+    if postings:
+        positions = min(postings, key=len)  # shortest posting list walked
+        first = bisect_left(positions, low)
+        last = bisect_left(positions, high)
+        for i in range(first, last):
+            order = orders[positions[i]]
+            if recipe and order['Recipe'] != recipe:
+                continue
+            if customer and order['Customer'] != customer:
+                continue
+            yield order
+    else:
+        for position in range(low, high):
+            yield orders[position]
+
+
+def total_quantity(
+        start=None,
+        end=None,
+        recipe: str = "",
+        customer: str = "") -> int:
+    """
+    Returns the total number of bottles in the orders matching a query
+
+    Totals for a beer across all customers are read from the sales
+    rollups instead of the individual orders.
+
+    Arguments:
+    start - the first date to include (optional)
+    end - the last date to include (optional)
+    recipe - only include orders of this beer (optional)
+    customer - only include orders from this customer (optional)
+    """
+    if recipe and not customer:
+        first = last = None
+        if start is not None:
+            first = date.fromordinal(to_ordinal(start))
+        if end is not None:  # rollup ranges end the day after
+            last = date.fromordinal(to_ordinal(end) + 1)
+        return rollups.total_quantity(recipe, first, last)
+    return sum(int(order['Quantity ordered'])
+               for order in query_orders(start, end, recipe, customer))
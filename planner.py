@@ -0,0 +1,313 @@
+"""
+This module plans which beers to brew over the coming weeks, choosing
+the recipe, volume, tanks and start date of each batch so that as much
+of the predicted demand as possible is covered by the stock
+"""
+import heapq
+import math
+from datetime import datetime, timedelta
+import bottling
+import brewery
+import prediction
+from models import BOTTLE_ML, litres_to_ml
+
+MAX_BATCH = 1000  # largest batch in litres
+DAYS_PER_MONTH = 30
+
+
+def get_demand(days: int, model: str = "growth") -> dict:
+    """
+    Returns the cumulative predicted demand of each beer for each day
+
+    Each month's predicted sales are spread evenly over its days, and
+    demand[beer][day] is the number of bottles predicted to be sold
+    from today up to that day.
+
+    Arguments:
+    days - the number of days to predict demand for
+    model - the name of the forecasting model used for the predictions
+    """
+    months = days // DAYS_PER_MONTH + 1
+    demand = {beer: [0.0] for beer in brewery.RECIPES}
+    for month in range(1, months + 1):
+        ratio, predictions = prediction.growth_rate(month, model)
+        for beer in brewery.RECIPES:
+            daily = max(predictions[beer]['prediction'], 0) / DAYS_PER_MONTH
+            cumulative = demand[beer]
+            for day in range(DAYS_PER_MONTH):
+                if len(cumulative) > days:
+                    break
+                cumulative.append(cumulative[-1] + daily)
+    return demand
+
+
+def get_stock() -> dict:
+    """Returns the bottles of each beer bottled or already in production"""
+    totals = brewery.get_totals()
+    stock = {}
+    for beer in brewery.RECIPES:
+        stock[beer] = (totals['bottled'].get(beer, 0)
+                       + totals['production'].get(beer, 0))
+    return stock
+
+
+def days_until_free(container: dict, today: datetime,
+                    state: str = None) -> int:
+    """
+    Returns the number of days until a container can be used
+
+    A tank in use is not free until the batch in it has finished its
+    stage (at the earliest tomorrow, if the stage is overdue), and a
+    batch fermenting in a tank which can also condition stays there for
+    conditioning too. If the finish date of the stage is not known the
+    whole stage is allowed for.
+
+    Arguments:
+    container - dictionary containing the container data
+    today - the date the plan starts from
+    state - the state of the batch in the container, if there is one
+    """
+    if not container['occupied']:
+        return 0
+    if container['finish'] != "-1":
+        finish = datetime.strptime(container['finish'], '%Y-%m-%d')
+        remaining = max((finish - today).days, 1)
+    elif state == "conditioning":
+        remaining = brewery.CONDITIONING_DAYS
+    else:
+        remaining = brewery.FERMENTATION_DAYS
+    if state == "fermentation" and container['conditioner']:
+        remaining += brewery.CONDITIONING_DAYS  # batch conditions here too
+    return remaining
+
+
+def cover_day(cumulative: list, supply: list) -> int:
+    """
+    Returns the first day on which demand for a beer exceeds its supply
+
+    Arguments:
+    cumulative - the cumulative demand for the beer on each day
+    supply - the cumulative bottles of the beer available on each day
+    """
+    for day, needed in enumerate(cumulative):
+        if needed > supply[day]:
+            return day
+    return len(cumulative)
+
+
+def bottles_served(cumulative: list, supply: list) -> float:
+    """
+    Returns the bottles of demand which are met on the day they are due
+
+    Bottles which arrive after the demand for them are not counted, as
+    those sales would have been lost.
+
+    Arguments:
+    cumulative - the cumulative demand for the beer on each day
+    supply - the cumulative bottles of the beer available on each day
+    """
+    served = 0.0
+    available = supply[0]
+    for day in range(1, len(cumulative)):
+        available += supply[day] - supply[day - 1]  # bottles arriving
+        wanted = cumulative[day] - cumulative[day - 1]
+        taken = min(wanted, available)
+        served += taken
+        available -= taken
+    return served
+
+
+def plan_brews(
+        weeks: int = 12,
+        containers: dict = None,
+        stock: dict = None,
+        demand: dict = None,
+        today: datetime = None,
+        batches: dict = None,
+        line_free: float = None,
+        rate: int = bottling.BOTTLES_PER_HOUR) -> dict:
+    """
+    Plans which beer to brew in which tank, and when, over several weeks
+
+    Fermenting tanks are taken in the order they become free (using a
+    heap). Each free tank is given one of the beers which will be short
+    by the end of the plan, in the volume needed to cover the shortfall
+    (up to the size of the tank), as long as the batch can be finished
+    within the plan. The beer which runs out of stock first is chosen,
+    skipping beers whose batch would not be ready before they run out
+    unless no batch can be ready in time for any beer. Tanks which can
+    also condition keep their batch for both stages; batches in other
+    tanks are moved to the conditioning tank which is free soonest.
+    Tanks in use are free once their batches have finished the stages
+    they still have to go through there. Conditioned batches then wait
+    for the bottling line, which bottles one batch at a time at its
+    rate. Each step only looks at the next free tank and the beers, so
+    plans for hundreds of tanks take well under a second. The bottles
+    of each planned batch only count towards the supply from the day
+    they are bottled, so a batch can not cover demand due before it is
+    ready.
+
+    The plan is returned as a dictionary with the 'schedule' of batches
+    and the 'coverage' of the demand for each beer.
+
+    Arguments:
+    weeks - the number of weeks to plan for
+    containers - dictionary of container data (read from file if omitted)
+    stock - bottles of each beer available (read from file if omitted)
+    demand - cumulative demand of each beer per day (predicted if omitted)
+    today - the date the plan starts from (today if omitted)
+    batches - dictionary of batch data (read from file if omitted)
+    line_free - days until the bottling line has bottled the batches
+                already queued (from the line's schedule if omitted)
+    rate - the number of bottles the bottling line fills each hour
+    """
+    days = weeks * 7
+    if today is None:
+        today = datetime.strptime(
+            datetime.today().strftime('%Y-%m-%d'), '%Y-%m-%d')
+    if containers is None:
+        containers = brewery.read_data('containers')
+    if batches is None:
+        batches = brewery.read_data('inventory')
+    if stock is None:
+        stock = get_stock()
+    if demand is None:
+        demand = get_demand(days)
+    if line_free is None:
+        line_free = bottling.line_free_days(brewery.bottling_schedule(
+            rate=rate), today)
+    fermenting = brewery.FERMENTATION_DAYS
+    conditioning = brewery.CONDITIONING_DAYS
+
+    def bottled(conditioned: int, volume: int) -> float:
+        """Returns the day a batch conditioned by a day is bottled"""
+        hours = bottling.bottling_hours(
+            litres_to_ml(volume) // BOTTLE_ML, rate)
+        return max(conditioned, line_free) + hours / 24
+
+    fermenters = []  # heaps of (day free, name) for each kind of tank
+    conditioners = []
+    largest_conditioner = 0
+    states = {}  # state of the batch in each container
+    for batchdata in batches.values():
+        states[batchdata['id']] = batchdata['state']
+    for name, container in containers.items():
+        free = days_until_free(container, today, states.get(container['id']))
+        if container['fermenter']:
+            fermenters.append((free, name))
+        elif container['conditioner']:
+            conditioners.append((free, name))
+            largest_conditioner = max(largest_conditioner,
+                                      container['volume'])
+    heapq.heapify(fermenters)
+    heapq.heapify(conditioners)
+
+    def soonest_conditioner(volume: int, take: bool = False) -> tuple:
+        """Returns the conditioning tank big enough for a batch free first"""
+        waiting = []  # conditioning tanks too small for the batch
+        while conditioners and containers[conditioners[0][1]][
+                'volume'] < volume:
+            waiting.append(heapq.heappop(conditioners))
+        found = conditioners[0] if conditioners else None
+        if found and take:
+            heapq.heappop(conditioners)
+        for item in waiting:
+            heapq.heappush(conditioners, item)
+        return found
+
+    def plan_batch(beer: str, start: int, name: str) -> dict:
+        """Returns a batch of a beer in a tank, if it can be finished"""
+        shortfall = demand[beer][days] - supply[beer][days]
+        tank = containers[name]
+        volume = min(math.ceil(shortfall * BOTTLE_ML / 1000),
+                     tank['volume'], MAX_BATCH)  # litres to fill the bottles
+        if tank['conditioner']:  # batch conditions in the same tank
+            conditioner = name
+            conditioning_start = start + fermenting
+            released = conditioning_start + conditioning
+        else:
+            volume = min(volume, largest_conditioner)
+            found = soonest_conditioner(volume)
+            if found is None:
+                return None  # this tank can not be used without a conditioner
+            free, conditioner = found
+            conditioning_start = max(start + fermenting, free)
+            released = conditioning_start  # fermenter free once moved
+        finished = bottled(conditioning_start + conditioning, volume)
+        if finished > days:
+            return None  # batch could not be finished within the plan
+        return {
+            'volume': volume,
+            'conditioner': conditioner,
+            'conditioned': conditioning_start + conditioning,
+            'released': released,
+            'bottled': finished,
+            'ready': math.ceil(finished)}  # line busy until it is bottled
+
+    supply = {}  # cumulative bottles of each beer available on each day
+    for beer in demand:
+        supply[beer] = [stock.get(beer, 0)] * (days + 1)
+    schedule = []
+    while fermenters:
+        start, name = heapq.heappop(fermenters)
+        if start + fermenting + conditioning >= days:
+            break  # later batches would not be finished within the plan
+        short = [beer for beer in demand
+                 if demand[beer][days] > supply[beer][days]]
+        if not short:
+            break  # every beer is covered for the whole plan
+        options = []  # (day the beer runs out, beer, batch)
+        for beer in short:
+            batch = plan_batch(beer, start, name)
+            if batch:
+                options.append(
+                    (cover_day(demand[beer], supply[beer]), beer, batch))
+        if not options:
+            continue  # no batch in this tank could be finished in time
+        in_time = [option for option in options
+                   if option[2]['ready'] <= option[0]]
+        runs_out, beer, batch = min(in_time or options,
+                                    key=lambda option: option[0])
+        if not containers[name]['conditioner']:
+            soonest_conditioner(batch['volume'], take=True)
+            heapq.heappush(conditioners,
+                           (batch['conditioned'], batch['conditioner']))
+        line_free = batch['bottled']
+        bottles = litres_to_ml(batch['volume']) // BOTTLE_ML
+        for day in range(batch['ready'], days + 1):  # bottles once ready
+            supply[beer][day] += bottles
+        schedule.append({
+            'week': start // 7 + 1,
+            'start': (today + timedelta(days=start)).strftime('%Y-%m-%d'),
+            'recipe': beer,
+            'volume': batch['volume'],
+            'fermenter': name,
+            'conditioner': batch['conditioner'],
+            'ready': (today + timedelta(days=batch['ready'])).strftime(
+                '%Y-%m-%d')})
+        heapq.heappush(fermenters, (batch['released'], name))
+
+    coverage = {}
+    for beer in demand:
+        needed = demand[beer][days]
+        coverage[beer] = {
+            'demand': int(needed),
+            'supply': int(supply[beer][days]),
+            'covered': round(min(bottles_served(
+                demand[beer], supply[beer]) / needed, 1.0), 3)
+            if needed else 1.0}
+    return {'schedule': schedule, 'coverage': coverage}
+
+
+if __name__ == "__main__":
+    import sys
+    weeks = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    plan = plan_brews(weeks)
+    for batch in plan['schedule']:
+        print("Week %d (%s): %s, %d litres in %s, conditioned in %s, "
+              "ready %s" % (batch['week'], batch['start'], batch['recipe'],
+                            batch['volume'], batch['fermenter'],
+                            batch['conditioner'], batch['ready']))
+    for beer, info in plan['coverage'].items():
+        print("%s: %d of %d bottles covered (%.0f%%)" % (
+            beer, info['supply'], info['demand'], info['covered'] * 100))
@@ -2,9 +2,126 @@
 This module is used to generate a prediction of sales for
 given months in the future
 """
+import copy
 import csv
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import Tuple
+from typing import Tuple, Union
+import forecasting
+import rollups
+from sketches import CountMinSketch, HyperLogLog, QuantileSketch
+
+SALES_FILE = 'test_data.csv'
+_sales_cache = {'fingerprint': None, 'orders': []}
+FORECAST_CACHE_SIZE = 64
+_forecast_cache = OrderedDict()
+_forecast_stats = {'fingerprint': None, 'hits': 0, 'misses': 0,
+                   'evictions': 0, 'invalidations': 0}
+_forecast_lock = threading.RLock()  # cache shared with background threads
+GROWTH_WINDOW = 12  # months of sales used for the average and growth rate
+_windows = {}  # rolling window of each beer and window size
+
+
+class RollingWindow:
+    """
+    Running totals of the sales and growth rates over the last few months
+
+    When a month is added the month which falls out of the window is
+    taken off the totals, so the average sale and average growth rate
+    are kept up to date without adding up the whole history again.
+    Growth from a month with no sales can not be calculated, so it is
+    left out of the average growth rate.
+    """
+    __slots__ = ('size', 'sales', 'growths', 'total', 'total_growth',
+                 'growth_months', 'pushed')
+
+    def __init__(self, size: int = GROWTH_WINDOW, start: int = 0):
+        """
+        Arguments:
+        size - the number of months in the window
+        start - the number of months of history before the first month added
+        """
+        if size < 1:
+            raise ValueError("A window must hold at least one month")
+        self.size = size
+        self.sales = deque()
+        self.growths = deque()  # growth into each month after the first
+        self.total = 0
+        self.total_growth = 0.0
+        self.growth_months = 0
+        self.pushed = start  # months of history the window has reached
+
+    def push(self, sale: int) -> None:
+        """
+        Adds the sales of the next month, dropping the oldest if needed
+
+        Arguments:
+        sale - the number of bottles sold in the month
+        """
+        if self.sales:
+            previous = self.sales[-1]
+            growth = float(sale - previous) / previous if previous else None
+            self.growths.append(growth)
+            if growth is not None:
+                self.total_growth += growth
+                self.growth_months += 1
+        self.sales.append(sale)
+        self.total += sale
+        self.pushed += 1
+        if len(self.sales) > self.size:  # oldest month leaves the window
+            self.total -= self.sales.popleft()
+            growth = self.growths.popleft()
+            if growth is not None:
+                self.total_growth -= growth
+                self.growth_months -= 1
+
+    def update(self, history: list) -> None:
+        """
+        Adds the months of the history which have not been added yet
+
+        Arguments:
+        history - list of the monthly sales, oldest month first
+        """
+        for sale in history[self.pushed:]:
+            self.push(sale)
+
+    def average(self) -> float:
+        """Returns the average monthly sale in the window"""
+        return float(self.total) / len(self.sales) if self.sales else 0.0
+
+    def growth(self) -> float:
+        """Returns the average growth rate per month in the window"""
+        if not self.growth_months:
+            return 0.0
+        return self.total_growth / self.growth_months
+
+
+def get_window(beer: str, history: list, size: int = GROWTH_WINDOW
+               ) -> RollingWindow:
+    """
+    Returns the rolling window of a beer, brought up to date
+
+    The window is kept between calls, so only months added to the sales
+    since the last call are pushed into it. If any month it already holds
+    has changed (e.g. more orders for the current month, or a back-dated
+    order) the window is rebuilt from just the last few months of history.
+
+    Arguments:
+    beer - the name of the beer
+    history - list of the monthly sales, oldest month first
+    size - the number of months in the window
+    """
+    window = _windows.get((beer, size))
+    if (window is None or window.pushed > len(history)
+            or list(window.sales) != history[
+                window.pushed - len(window.sales):window.pushed]):
+        window = RollingWindow(size, max(len(history) - size, 0))
+        _windows[(beer, size)] = window
+    window.update(history)
+    return window
 
 
 def calculate_ratio(totals: dict) -> list:
@@ -16,7 +133,7 @@ def calculate_ratio(totals: dict) -> list:
     as a list of values.
 
     Arguments:
-    totals - the total sales of each beer over the last 12 months
+    totals - the total sales of each beer over the window of months
     """
     ratio = []
     ratio.append(totals['Organic Red Helles']) #total sales appended
@@ -33,78 +150,134 @@ def calculate_ratio(totals: dict) -> list:
     return ratio
 
 
-def growth_rate(timeframe: int = 1) -> Tuple:
+def growth_rate(
+        timeframe: int = 1,
+        model: Union[str, dict] = "growth",
+        window: int = GROWTH_WINDOW) -> Tuple:
     """
-    Calculates the average growth rate and returns the predicted sales
+    Returns the ratio of sales and the predicted sales, using a cache
 
-    This function calculates the average growth rate per month in the
-    last 12 months and uses this value to produce a prediction for the
-    sales in a given month. The function returns the predictions and
-    the ratio of sales between each beer.
+    Predictions are cached by the fingerprint of the sales data, the
+    model, the number of months and the window, so repeated requests for
+    the same prediction are not recalculated. The least recently used
+    prediction is dropped once FORECAST_CACHE_SIZE predictions are cached,
+    and the whole cache is cleared when the sales data changes.
 
     Arguments:
     timeframe - the number of months in the future to predict for
+    model - the name of the forecasting model used for the prediction, or
+            a dictionary of the model for each beer (see calculate_predictions)
+    window - the number of recent months the growth rate is taken over
     """
-    sales = {}
-    # sales read in from file
-    sales['Organic Red Helles'] = read_in_sales("Organic Red Helles")
-    sales['Organic Pilsner'] = read_in_sales("Organic Pilsner")
-    sales['Organic Dunkel'] = read_in_sales("Organic Dunkel")
-    predictions = {}
-    for key, value in sales.items():
-        total_growth = 0
-        for i in range(2, 13):  # calculates growth rate between months
-            growth = float(value[str(i)] - value[str(i - 1)]) / float(value[str(i - 1)])
-            total_growth += growth
-            # average growth rate calculated
-        average_growth = float(total_growth / 11)
-        predictions[key] = sales_predictions(value, average_growth, timeframe)
-        predictions[key]['growth'] = float("%.3f" % average_growth)
-    ratio = get_sales_ratio(sales)  # ratio of sales calculated
-    return ratio, predictions
+    if not isinstance(model, str):  # dictionaries cannot be cache keys
+        model = tuple(sorted(model.items()))
+    with _forecast_lock:
+        fingerprint = dataset_fingerprint()
+        if _forecast_stats['fingerprint'] != fingerprint:
+            if _forecast_cache:  # sales data changed, old predictions dropped
+                _forecast_stats['invalidations'] += 1
+            _forecast_cache.clear()
+            _forecast_stats['fingerprint'] = fingerprint
+        key = (fingerprint, model, int(timeframe), int(window))
+        if key in _forecast_cache:
+            _forecast_stats['hits'] += 1
+            _forecast_cache.move_to_end(key)  # most recently used
+        else:
+            _forecast_stats['misses'] += 1
+            _forecast_cache[key] = calculate_predictions(
+                timeframe, dict(model) if isinstance(model, tuple) else model,
+                int(window))
+            if len(_forecast_cache) > FORECAST_CACHE_SIZE:
+                _forecast_cache.popitem(last=False)  # least recently used
+                _forecast_stats['evictions'] += 1
+        return copy.deepcopy(_forecast_cache[key])  # callers can edit safely
+
+
+def forecast_cache_info() -> dict:
+    """Returns the hit, miss and eviction statistics of the forecast cache"""
+    info = {key: value for key, value in _forecast_stats.items()
+            if key != 'fingerprint'}
+    info['size'] = len(_forecast_cache)
+    info['maxsize'] = FORECAST_CACHE_SIZE
+    return info
+
 
+def clear_forecast_cache() -> None:
+    """Removes every cached prediction and resets the statistics"""
+    _forecast_cache.clear()
+    for key in ('hits', 'misses', 'evictions', 'invalidations'):
+        _forecast_stats[key] = 0
+    _forecast_stats['fingerprint'] = None
 
-def get_sales_ratio(sales: dict) -> list:
+
+def calculate_predictions(
+        timeframe: int = 1,
+        model: Union[str, dict] = "growth",
+        window: int = GROWTH_WINDOW) -> Tuple:
     """
-    Adds up the total yearly sale per beer and returns the ratio of sales
+    Calculates the average growth rate and returns the predicted sales
+
+    This function calculates the average growth rate per month over the
+    last few months (the window, 12 by default) and uses this value to
+    produce a prediction for the sales in a given month. The function
+    returns the predictions and the ratio of sales between each beer in
+    the window. Another forecasting model can be chosen to make the
+    prediction (see forecasting.MODELS), either one for every beer or a
+    dictionary of the model for each beer, such as the one returned by
+    forecasting.best_models. Beers missing from the dictionary use the
+    growth model.
 
     Arguments:
-    sales - dictionary containing the sales data for each beer for 1 year.
+    timeframe - the number of months in the future to predict for
+    model - the name of the forecasting model used for the prediction, or
+            a dictionary of the name of the model for each beer
+    window - the number of recent months the growth rate is taken over
     """
-    total_sold = {
-        'Organic Red Helles': 0,
-        'Organic Pilsner': 0,
-        'Organic Dunkel': 0}
-    for key, value in sales.items():
-        for month, sale in value.items():
-            total_sold[key] += int(sale)  # all of the sales are added up
-    return calculate_ratio(total_sold)  # ratio calculated
+    if isinstance(model, str):
+        models = {}
+        default = model
+    else:
+        models = model
+        default = "growth"
+    for name in set(models.values()) | {default}:
+        forecasting.get_model(name)  # unknown models rejected
+    history = monthly_sales()  # sales read in from file
+    predictions = {}
+    totals = {}
+    for key, value in history.items():
+        rolling = get_window(key, value, window)
+        average_growth = rolling.growth()
+        predictions[key] = sales_predictions(
+            rolling.average(), average_growth, timeframe)
+        name = models.get(key, default)
+        if name != "growth":  # prediction made by the chosen model
+            predictions[key]['prediction'] = int(
+                forecasting.get_model(name)(value, int(timeframe)))
+        predictions[key]['growth'] = float("%.3f" % average_growth)
+        totals[key] = rolling.total
+    ratio = calculate_ratio(totals)  # ratio of sales calculated
+    return ratio, predictions
 
 
 def sales_predictions(
-        monthly_sales: dict,
+        average: float,
         average_growth: float,
         timeframe: int) -> dict:
     """
     Calculates the predicted sale for one month for a beer
 
-    The function takes a dictionary of sales for one year and
-    calculates the average monthly sale, and uses this as well
-    as the average growth rate to make a prediction for a month
-    in the future. The prediction data is returned in a dictionary.
+    The function takes the average monthly sale of a beer, and uses
+    this as well as the average growth rate to make a prediction for a
+    month in the future. The prediction data is returned in a dictionary.
     Prediction formula = average_sale * (growth_rate ^ months)
 
     Arguments:
-    monthly_sales - Dictionary containing the monthly sales for a beer
+    average - the average monthly sale of the beer
     average_growth - the average growth rate for one beer per month
     timeframe - the number of months in the future to predict for.
     """
 
     data = {}
-    total = 0
-    for i in range(1, 13):
-        total = total + monthly_sales[str(i)]
-    average = float(total) / 12  # average monthly sale calculated
     growth = float(1 + average_growth)  # growth multiplier calculated
     data['average'] = int(average)
     data['prediction'] = int(average * growth**int(timeframe))
@@ -112,42 +285,239 @@ def sales_predictions(
     return data
 
 
+def monthly_sales() -> dict:
+    """
+    Returns the monthly sales of each beer as lists, oldest month first
+
+    This is the form of sales data used by the forecasting models.
+    """
+    sales = {}
+    for beer in ('Organic Red Helles', 'Organic Pilsner', 'Organic Dunkel'):
+        months = read_in_sales(beer)
+        sales[beer] = [months[str(i)] for i in range(1, len(months) + 1)]
+    return sales
+
+
 def read_in_sales(beer: str) -> dict:
     """
     Finds the number of sales per month for a type of beer
 
+    The sales are read from the monthly rollup of the orders, and the
+    months with sales are numbered from 1, oldest first.
+
     Arguments:
     beer - the name of the beer
     """
     sales = {}
-    previous = 0
-    month_number = 0
-    data = csv_read()
-    for order in data:
-        if order['Recipe'] == beer:  # beers are read in individually
-            month = datetime.strptime(order['Date Required'], '%d-%b-%y').month
-            if month != previous:
-            # if this record is from a different month to the last one
-                previous = month
-                month_number += 1  # increase months by 1
-            if str(month_number) in sales:
-                pass
-            else:
-                sales[str(month_number)] = 0  # month added to the file
-                # sale for that month added to total
-            sales[str(month_number)] += int(order["Quantity ordered"])
+    for month_number, total in enumerate(rollups.monthly_sales(beer), 1):
+        sales[str(month_number)] = total  # sale for that month added
     return sales
 
 
+def dataset_fingerprint() -> tuple:
+    """
+    Returns a fingerprint of the sales data file
+
+    The fingerprint is made from the name, modification time and size of
+    the file, so it changes whenever the sales data is changed.
+    """
+    stat = os.stat(SALES_FILE)
+    return (SALES_FILE, stat.st_mtime_ns, stat.st_size)
+
+
 def csv_read() -> list:
-    """Reads in all previous sales data from the file"""
-    data = []
-    with open('test_data.csv') as f:
-        # open file
-        for row in csv.DictReader(f):
-            data.append({key: data for key, data in row.items()})
-        # read rows in as a sorted list of dictionaries
-        data = sorted(
-            data, key=lambda k: datetime.strptime(
-                k['Date Required'], '%d-%b-%y'))
-    return data
+    """
+    Reads in all previous sales data from the file
+
+    The sorted orders are cached, and are only read in from the file
+    again when the fingerprint of the file changes. A new list is
+    returned each time so callers can reorder it safely.
+    """
+    fingerprint = dataset_fingerprint()
+    if _sales_cache['fingerprint'] != fingerprint:
+        data = []
+        dates = {}  # each distinct date is only parsed once
+        with open(SALES_FILE) as f:
+            # open file
+            for row in csv.DictReader(f):
+                data.append({key: data for key, data in row.items()})
+                if row['Date Required'] not in dates:
+                    dates[row['Date Required']] = datetime.strptime(
+                        row['Date Required'], '%d-%b-%y')
+            # read rows in as a sorted list of dictionaries
+            data = sorted(data, key=lambda k: dates[k['Date Required']])
+        _sales_cache['orders'] = data
+        _sales_cache['fingerprint'] = fingerprint
+    return list(_sales_cache['orders'])
+
+
+def new_order_summary() -> dict:
+    """
+    Returns an empty streaming summary of orders
+
+    The summary contains:
+    orders - the number of order lines summarised
+    quantities - a quantile sketch of the bottles per order of each beer
+    customer_orders - a count-min sketch of the order lines of each customer
+    customer_bottles - a count-min sketch of the bottles of each customer
+    monthly_customers - a HyperLogLog of the customers in each month
+    """
+    return {
+        'orders': 0,
+        'quantities': {},
+        'customer_orders': CountMinSketch(),
+        'customer_bottles': CountMinSketch(),
+        'monthly_customers': {}}
+
+
+def summarise_orders(path: str) -> dict:
+    """
+    Summarises the orders in a sales data file in a single pass
+
+    Each order is added to the sketches as it is read and is not kept,
+    so files of any size are summarised in the same small amount of
+    memory.
+
+    Arguments:
+    path - the path of a file with the same columns as the sales data
+    """
+    summary = new_order_summary()
+    months = {}  # each distinct date is only parsed once
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return summary
+        customer_column = header.index('Customer')
+        date_column = header.index('Date Required')
+        recipe_column = header.index('Recipe')
+        quantity_column = header.index('Quantity ordered')
+        quantities = summary['quantities']
+        monthly = summary['monthly_customers']
+        for row in reader:
+            if not row:
+                continue
+            customer = row[customer_column]
+            quantity = int(row[quantity_column])
+            date = row[date_column]
+            if date not in months:
+                months[date] = datetime.strptime(date, '%d-%b-%y').strftime(
+                    '%Y-%m')
+            month = months[date]
+            recipe = row[recipe_column]
+            if recipe not in quantities:
+                quantities[recipe] = QuantileSketch()
+            quantities[recipe].add(quantity)
+            summary['customer_orders'].add(customer)
+            summary['customer_bottles'].add(customer, quantity)
+            if month not in monthly:
+                monthly[month] = HyperLogLog()
+            monthly[month].add(customer)
+            summary['orders'] += 1
+    return summary
+
+
+def merge_order_summaries(summaries) -> dict:
+    """
+    Combines the summaries of several files into one summary
+
+    The sketches are merged into new sketches, so the summaries passed
+    in are left as they were and can be merged again.
+
+    Arguments:
+    summaries - iterable of summaries returned by summarise_orders
+    """
+    empty = {  # new sketch with the same settings as a sketch
+        'quantities': lambda sketch: QuantileSketch(sketch.accuracy,
+                                                    sketch.max_buckets),
+        'monthly_customers': lambda sketch: HyperLogLog(sketch.precision)}
+    merged = new_order_summary()
+    for summary in summaries:
+        merged['orders'] += summary['orders']
+        for section in ('quantities', 'monthly_customers'):
+            for key, sketch in summary[section].items():
+                if key not in merged[section]:
+                    merged[section][key] = empty[section](sketch)
+                merged[section][key].merge(sketch)
+        for section in ('customer_orders', 'customer_bottles'):
+            merged[section].merge(summary[section])
+    return merged
+
+
+def stream_orders(paths: list = None, workers: int = 1) -> dict:
+    """
+    Summarises the orders in one or more sales data files
+
+    Each file is summarised on its own (in a separate worker process if
+    there is more than one worker) and the summaries are merged, so the
+    memory used does not depend on the number of orders.
+
+    Arguments:
+    paths - the paths of the files to read (SALES_FILE if omitted)
+    workers - the number of worker processes (None for one per CPU)
+    """
+    if not paths:
+        paths = [SALES_FILE]
+    if workers == 1 or len(paths) == 1:
+        return merge_order_summaries(map(summarise_orders, paths))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return merge_order_summaries(executor.map(summarise_orders, paths))
+
+
+def order_quantile(summary: dict, recipe: str, fraction: float) -> float:
+    """
+    Returns a percentile of the bottles per order of a beer
+
+    Arguments:
+    summary - the summary returned by stream_orders
+    recipe - the beer
+    fraction - the percentile as a fraction, e.g. 0.95
+    """
+    sketch = summary['quantities'].get(recipe)
+    return sketch.quantile(fraction) if sketch else None
+
+
+def top_customers(summary: dict, count: int = 10,
+                  by: str = 'bottles') -> list:
+    """
+    Returns the customers with the most bottles (or orders) and their totals
+
+    Arguments:
+    summary - the summary returned by stream_orders
+    count - the number of customers to return
+    by - 'bottles' or 'orders'
+    """
+    return summary['customer_%s' % by].most_common(count)
+
+
+def distinct_customers(summary: dict, month: str) -> int:
+    """
+    Returns the estimated number of different customers in a month
+
+    Arguments:
+    summary - the summary returned by stream_orders
+    month - the month, e.g. '2019-03'
+    """
+    sketch = summary['monthly_customers'].get(month)
+    return sketch.count() if sketch else 0
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Summarise large order histories in a single pass")
+    parser.add_argument('files', nargs='*', help="sales data files")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes (0 for one per CPU)")
+    options = parser.parse_args()
+    summary = stream_orders(options.files, options.workers or None)
+    print("%d order lines" % summary['orders'])
+    for recipe in sorted(summary['quantities']):
+        print("%s: median %.0f, 95th percentile %.0f bottles per order" % (
+            recipe, order_quantile(summary, recipe, 0.5),
+            order_quantile(summary, recipe, 0.95)))
+    for customer, bottles in top_customers(summary, 5):
+        print("%s: about %d bottles" % (customer, bottles))
+    for month in sorted(summary['monthly_customers']):
+        print("%s: about %d customers" % (
+            month, distinct_customers(summary, month)))
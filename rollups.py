@@ -0,0 +1,155 @@
+"""
+This module keeps rollup tables of the bottles of each beer ordered per
+day, week and month, so sales totals can be answered from a few rolled
+up periods instead of every order line
+"""
+import csv
+from datetime import date, datetime, timedelta
+import prediction
+
+GRAINS = ('month', 'week', 'day')  # coarsest first
+FIELDS = ('Invoice Number', 'Customer', 'Date Required', 'Recipe',
+          'Gyle Number', 'Quantity ordered')
+_rollups = {'fingerprint': None, 'data': None}
+
+
+def period_starts(day: date) -> dict:
+    """
+    Returns the first day of the day, week and month containing a date
+
+    Each period is identified by the day number (ordinal) of its first
+    day, so all three rollups can be searched in the same way.
+
+    Arguments:
+    day - the date of the order
+    """
+    return {
+        'day': day.toordinal(),
+        'week': (day - timedelta(days=day.weekday())).toordinal(),
+        'month': day.replace(day=1).toordinal()}
+
+
+def add_order(rollups: dict, recipe: str, day: date, quantity: int) -> None:
+    """
+    Adds the bottles of one order to the day, week and month rollups
+
+    Arguments:
+    rollups - the rollup tables to update
+    recipe - the beer which was ordered
+    day - the date the order was required
+    quantity - the number of bottles ordered
+    """
+    for grain, start in period_starts(day).items():
+        table = rollups[grain].setdefault(recipe, {})
+        table[start] = table.get(start, 0) + quantity
+
+
+def build_rollups(orders: list) -> dict:
+    """
+    Builds the day, week and month rollups of the orders in a single pass
+
+    Arguments:
+    orders - list of dictionaries containing the past orders
+    """
+    rollups = {grain: {} for grain in GRAINS}
+    dates = {}  # each distinct date is only parsed once
+    for order in orders:
+        required = order['Date Required']
+        if required not in dates:
+            dates[required] = datetime.strptime(required, '%d-%b-%y').date()
+        add_order(rollups, order['Recipe'], dates[required],
+                  int(order['Quantity ordered']))
+    return rollups
+
+
+def get_rollups() -> dict:
+    """Returns the rollup tables, rebuilding them if the sales data changed"""
+    fingerprint = prediction.dataset_fingerprint()
+    if _rollups['fingerprint'] != fingerprint:
+        _rollups['data'] = build_rollups(prediction.csv_read())
+        _rollups['fingerprint'] = fingerprint
+    return _rollups['data']
+
+
+def ingest_orders(orders: list) -> None:
+    """
+    Adds new orders to the sales data and to the rollup tables
+
+    Every order is checked before any are written, and a ValueError is
+    raised if one is missing a column or has an invalid date or quantity,
+    so the sales data and the rollups are never left holding only some
+    of the orders. The orders are then appended to the sales data file
+    and added to the rollups, so the rollups do not need to be rebuilt
+    from every order afterwards.
+
+    Arguments:
+    orders - list of dictionaries with the same columns as the sales data
+    """
+    rows = []
+    parsed = []
+    for number, order in enumerate(orders, 1):
+        try:
+            rows.append({field: order[field] for field in FIELDS})
+            day = datetime.strptime(order['Date Required'], '%d-%b-%y').date()
+            parsed.append((order['Recipe'], day,
+                           int(order['Quantity ordered'])))
+        except (KeyError, TypeError, ValueError) as error:
+            raise ValueError("Order %d is invalid: %s" % (number, error))
+    rollups = get_rollups()
+    with open(prediction.SALES_FILE, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS, lineterminator='\r\n')
+        writer.writerows(rows)
+    for recipe, day, quantity in parsed:
+        add_order(rollups, recipe, day, quantity)
+    _rollups['fingerprint'] = prediction.dataset_fingerprint()
+
+
+def choose_grain(start: date, end: date) -> str:
+    """
+    Returns the coarsest rollup whose periods exactly fill a date range
+
+    Arguments:
+    start - the first day of the range
+    end - the day after the last day of the range
+    """
+    if start.day == 1 and end.day == 1:
+        return 'month'
+    if start.weekday() == 0 and end.weekday() == 0:
+        return 'week'
+    return 'day'
+
+
+def total_quantity(recipe: str, start: date = None, end: date = None) -> int:
+    """
+    Returns the bottles of a beer ordered in a date range
+
+    The coarsest rollup which answers the question is used, e.g. whole
+    months are added up from the monthly rollup.
+
+    Arguments:
+    recipe - the beer to add up the orders of
+    start - the first day of the range (optional)
+    end - the day after the last day of the range (optional)
+    """
+    if start is None:
+        start = date.min  # before every order, and the start of a month
+    if end is None:
+        end = date.max.replace(day=1)  # after every order
+    table = get_rollups()[choose_grain(start, end)].get(recipe, {})
+    first = start.toordinal()
+    last = end.toordinal()
+    return sum(quantity for period, quantity in table.items()
+               if first <= period < last)
+
+
+def monthly_sales(recipe: str) -> list:
+    """
+    Returns the bottles of a beer ordered in each month with orders
+
+    The months are in order, oldest first.
+
+    Arguments:
+    recipe - the beer to find the monthly sales of
+    """
+    table = get_rollups()['month'].get(recipe, {})
+    return [table[month] for month in sorted(table)]
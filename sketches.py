@@ -0,0 +1,270 @@
+"""
+This module contains small approximate summaries (sketches) of streams
+of values, which use a fixed amount of memory however many values are
+added.
+
+QuantileSketch answers percentile questions to within a relative error,
+CountMinSketch counts how often each key occurs and keeps the most
+frequent keys, and HyperLogLog counts distinct keys. Sketches of the
+same kind and size can be merged, so separate files or processes can be
+summarised on their own and combined afterwards. Keys are hashed with
+hashlib, so the same key always lands in the same place in every process.
+"""
+import hashlib
+import heapq
+import math
+from array import array
+
+
+def hash64(key: str, salt: bytes = b"") -> int:
+    """
+    Returns a 64 bit hash of a key which is the same in every process
+
+    Arguments:
+    key - the key to hash
+    salt - up to 16 bytes which change the hash, for independent hashes
+    """
+    digest = hashlib.blake2b(str(key).encode('utf-8'), digest_size=8,
+                             salt=salt).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class QuantileSketch:
+    """
+    Sketch of positive values which answers percentile questions
+
+    Values are counted in buckets whose edges grow by a fixed ratio, so
+    any percentile is returned to within the relative accuracy (1% by
+    default) of the true value, in the style of DDSketch. If there are
+    more than max_buckets buckets the lowest are merged together, which
+    only affects the accuracy of the lowest percentiles.
+    """
+    __slots__ = ('accuracy', 'gamma', 'log_gamma', 'max_buckets', 'buckets',
+                 'zeros', 'count', 'minimum', 'maximum')
+
+    def __init__(self, accuracy: float = 0.01, max_buckets: int = 2048):
+        if not 0 < accuracy < 1:
+            raise ValueError("The accuracy must be between 0 and 1")
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.buckets = {}  # count of values in each bucket
+        self.zeros = 0  # values of zero (or less) are counted together
+        self.count = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def add(self, value: float, count: int = 1) -> None:
+        """
+        Adds a value to the sketch
+
+        Arguments:
+        value - the value to add
+        count - the number of times to add it
+        """
+        if value > 0:
+            index = math.ceil(math.log(value) / self.log_gamma)
+            self.buckets[index] = self.buckets.get(index, 0) + count
+            if len(self.buckets) > self.max_buckets:
+                self.collapse()
+        else:
+            self.zeros += count
+        self.count += count
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def collapse(self) -> None:
+        """Merges the lowest buckets until there are max_buckets left"""
+        indexes = sorted(self.buckets)
+        extra = len(indexes) - self.max_buckets
+        if extra > 0:
+            lowest = indexes[extra]
+            for index in indexes[:extra]:
+                self.buckets[lowest] += self.buckets.pop(index)
+
+    def quantile(self, q: float) -> float:
+        """
+        Returns the value below which a fraction of the values fall
+
+        Arguments:
+        q - the fraction, e.g. 0.5 for the median or 0.95
+        """
+        if not self.count:
+            return None
+        if not 0 <= q <= 1:
+            raise ValueError("The fraction must be between 0 and 1")
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return min(self.minimum, 0.0)
+        seen = self.zeros
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.minimum), self.maximum)
+        return self.maximum
+
+    def merge(self, other: 'QuantileSketch') -> None:
+        """
+        Adds the values of another sketch with the same accuracy
+
+        Arguments:
+        other - the sketch to merge into this one
+        """
+        if other.accuracy != self.accuracy:
+            raise ValueError("Only sketches with the same accuracy can be "
+                             "merged")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self.collapse()
+        self.zeros += other.zeros
+        self.count += other.count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+
+class CountMinSketch:
+    """
+    Sketch which estimates how often each key has been added
+
+    Each key is counted in one cell of every row of a table, and its
+    count is estimated as its smallest cell, which is never too low and
+    is too high by at most a small fraction of the total. The top keys
+    are kept alongside the table, so the most frequent keys can be
+    listed without storing every key.
+    """
+    __slots__ = ('width', 'depth', 'table', 'top_size', 'top', 'total')
+
+    def __init__(self, width: int = 2048, depth: int = 4,
+                 top_size: int = 20):
+        self.width = width
+        self.depth = depth
+        self.table = array('q', bytes(8 * width * depth))
+        self.top_size = top_size
+        self.top = {}  # estimated count of the most frequent keys
+        self.total = 0
+
+    def cells(self, key: str) -> list:
+        """Returns the position of the key's cell in each row of the table"""
+        first = hash64(key)
+        second = hash64(key, b"count-min") | 1
+        return [row * self.width + (first + row * second) % self.width
+                for row in range(self.depth)]
+
+    def add(self, key: str, count: int = 1) -> None:
+        """
+        Adds a key to the sketch
+
+        Arguments:
+        key - the key to count
+        count - the number of times to add it
+        """
+        estimate = None
+        for cell in self.cells(key):
+            self.table[cell] += count
+            if estimate is None or self.table[cell] < estimate:
+                estimate = self.table[cell]
+        self.total += count
+        self.keep_top(key, estimate)
+
+    def keep_top(self, key: str, estimate: int) -> None:
+        """Records a key's count if it is one of the most frequent keys"""
+        if key in self.top or len(self.top) < self.top_size:
+            self.top[key] = estimate
+            return
+        smallest = min(self.top, key=self.top.get)
+        if estimate > self.top[smallest]:
+            del self.top[smallest]
+            self.top[key] = estimate
+
+    def estimate(self, key: str) -> int:
+        """
+        Returns the estimated number of times a key has been added
+
+        Arguments:
+        key - the key to look up
+        """
+        return min(self.table[cell] for cell in self.cells(key))
+
+    def most_common(self, count: int = None) -> list:
+        """
+        Returns the most frequent keys and their counts, most frequent first
+
+        Arguments:
+        count - the number of keys to return (all the top keys if omitted)
+        """
+        return heapq.nlargest(count or self.top_size, self.top.items(),
+                              key=lambda item: (item[1], item[0]))
+
+    def merge(self, other: 'CountMinSketch') -> None:
+        """
+        Adds the counts of another sketch of the same size
+
+        Arguments:
+        other - the sketch to merge into this one
+        """
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Only sketches of the same size can be merged")
+        for cell, count in enumerate(other.table):
+            self.table[cell] += count
+        self.total += other.total
+        keys = set(self.top) | set(other.top)
+        self.top = {}
+        for key in keys:  # counts of the top keys looked up again
+            self.keep_top(key, self.estimate(key))
+
+
+class HyperLogLog:
+    """
+    Sketch which estimates the number of distinct keys added
+
+    Each key's hash chooses a register and the register keeps the
+    longest run of leading zeros seen, which uses 2^precision bytes
+    and is accurate to about 1.04 / sqrt(2^precision) (1.6% by default).
+    """
+    __slots__ = ('precision', 'registers')
+
+    def __init__(self, precision: int = 12):
+        if not 4 <= precision <= 16:
+            raise ValueError("The precision must be between 4 and 16")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, key: str) -> None:
+        """
+        Adds a key to the sketch
+
+        Arguments:
+        key - the key to add
+        """
+        hashed = hash64(key)
+        register = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        run = (64 - self.precision) - rest.bit_length() + 1
+        if run > self.registers[register]:
+            self.registers[register] = run
+
+    def count(self) -> int:
+        """Returns the estimated number of distinct keys"""
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / math.fsum(
+            2.0 ** -register for register in self.registers)
+        empty = self.registers.count(0)
+        if estimate <= 2.5 * size and empty:  # few keys, linear counting
+            estimate = size * math.log(size / float(empty))
+        return int(round(estimate))
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        """
+        Adds the keys of another sketch with the same precision
+
+        Arguments:
+        other - the sketch to merge into this one
+        """
+        if other.precision != self.precision:
+            raise ValueError("Only sketches with the same precision can be "
+                             "merged")
+        self.registers = bytearray(map(max, self.registers, other.registers))
@@ -0,0 +1,401 @@
+"""
+This module collects temperature and gravity readings from the tanks.
+
+Readings are kept in fixed size ring buffers for each tank, so memory
+use does not grow however long the readings come in. The most recent
+readings are kept as they are, and older readings are kept as the
+minimum, maximum and mean of each minute and each hour. Readings come
+from a local feed file with one "tank,metric,value,timestamp" line per
+reading, which can be filled with simulated readings for testing, e.g.
+    python telemetry.py simulate --rate 10
+"""
+import argparse
+import math
+import os
+import random
+import threading
+import time
+from array import array
+from typing import Iterator
+
+METRICS = ('temperature', 'gravity')
+FEED_FILE = 'telemetry.feed'
+FEED_MAX_BYTES = 1048576  # simulated feed starts again once this size
+RAW_SIZE = 600  # most recent readings kept as they are
+TIERS = (('minute', 60, 1440), ('hour', 3600, 720))  # name, seconds, size
+TREND_SECONDS = 3600  # readings used to work out the trend
+STEADY = {'temperature': 0.05, 'gravity': 0.0001}  # smallest change per hour
+PLACES = {'temperature': 1, 'gravity': 4}  # decimal places shown
+_series = {}  # readings of each (tank, metric)
+_lock = threading.Lock()  # readings are added from a background thread
+
+
+class RingBuffer:
+    """A fixed number of columns of numbers, overwriting the oldest row"""
+    __slots__ = ('size', 'columns', 'head', 'count')
+
+    def __init__(self, size: int, columns: int):
+        self.size = size
+        self.columns = [array('d', bytes(8 * size)) for i in range(columns)]
+        self.head = 0  # position the next row is written to
+        self.count = 0
+
+    def append(self, *values: float) -> None:
+        """Writes a row, replacing the oldest row once the buffer is full"""
+        for column, value in zip(self.columns, values):
+            column[self.head] = value
+        self.head = (self.head + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def rows(self) -> Iterator[tuple]:
+        """Yields each row, oldest first"""
+        start = (self.head - self.count) % self.size
+        for i in range(self.count):
+            position = (start + i) % self.size
+            yield tuple(column[position] for column in self.columns)
+
+    def last(self) -> tuple:
+        """Returns the newest row, or None if the buffer is empty"""
+        if not self.count:
+            return None
+        position = (self.head - 1) % self.size
+        return tuple(column[position] for column in self.columns)
+
+
+class Tier:
+    """
+    Readings downsampled to the minimum, maximum and mean of each period
+
+    Closed periods are kept in a ring buffer of (start, minimum, maximum,
+    mean) rows; the period still being filled is kept separately.
+    """
+    __slots__ = ('seconds', 'buffer', 'start', 'minimum', 'maximum',
+                 'total', 'count')
+
+    def __init__(self, seconds: int, size: int):
+        self.seconds = seconds
+        self.buffer = RingBuffer(size, 4)
+        self.start = None
+        self.minimum = self.maximum = self.total = 0.0
+        self.count = 0
+
+    def add(self, timestamp: float, value: float) -> None:
+        """Adds a reading to its period, closing the last period if needed"""
+        start = timestamp - timestamp % self.seconds
+        if start != self.start:
+            if self.count:
+                self.buffer.append(self.start, self.minimum, self.maximum,
+                                   self.total / self.count)
+            self.start = start
+            self.minimum = self.maximum = value
+            self.total = 0.0
+            self.count = 0
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        self.total += value
+        self.count += 1
+
+    def periods(self) -> list:
+        """Returns each period as a dictionary, oldest first"""
+        rows = list(self.buffer.rows())
+        if self.count:
+            rows.append((self.start, self.minimum, self.maximum,
+                         self.total / self.count))
+        return [{'start': start, 'min': minimum, 'max': maximum,
+                 'mean': mean} for start, minimum, maximum, mean in rows]
+
+
+class Series:
+    """The readings of one metric of one tank"""
+    __slots__ = ('raw', 'tiers')
+
+    def __init__(self):
+        self.raw = RingBuffer(RAW_SIZE, 2)  # (timestamp, value) rows
+        self.tiers = {name: Tier(seconds, size)
+                      for name, seconds, size in TIERS}
+
+    def add(self, timestamp: float, value: float) -> None:
+        """Adds a reading to the raw readings and every tier"""
+        self.raw.append(timestamp, value)
+        for tier in self.tiers.values():
+            tier.add(timestamp, value)
+
+
+def record(tank: str, metric: str, value: float,
+           timestamp: float = None) -> None:
+    """
+    Adds one reading from a tank
+
+    Arguments:
+    tank - the name of the container the reading is from
+    metric - the kind of reading, one of METRICS
+    value - the reading
+    timestamp - the time of the reading in seconds (now if omitted)
+    """
+    if metric not in METRICS:
+        raise ValueError("Unknown metric: %s" % metric)
+    if timestamp is None:
+        timestamp = time.time()
+    with _lock:
+        series = _series.get((tank.lower(), metric))
+        if series is None:
+            series = _series[(tank.lower(), metric)] = Series()
+        series.add(float(timestamp), float(value))
+
+
+def ingest(readings) -> int:
+    """
+    Adds many readings and returns the number added
+
+    Arguments:
+    readings - iterable of (tank, metric, value, timestamp) tuples
+    """
+    count = 0
+    for tank, metric, value, timestamp in readings:
+        record(tank, metric, value, timestamp)
+        count += 1
+    return count
+
+
+def clear() -> None:
+    """Removes every reading"""
+    with _lock:
+        _series.clear()
+
+
+def latest(tank: str, metric: str) -> float:
+    """
+    Returns the most recent reading of a tank, or None if there is none
+
+    Arguments:
+    tank - the name of the container
+    metric - the kind of reading, one of METRICS
+    """
+    with _lock:
+        series = _series.get((tank.lower(), metric))
+        row = series.raw.last() if series else None
+    return row[1] if row else None
+
+
+def trend(tank: str, metric: str, seconds: int = TREND_SECONDS) -> float:
+    """
+    Returns the change in a reading per hour, or None if it is not known
+
+    A straight line is fitted through the mean of each minute in the
+    last few seconds before the most recent reading, so noise in the
+    readings does not swing the trend. Until there are two minutes of
+    readings the raw readings are used instead.
+
+    Arguments:
+    tank - the name of the container
+    metric - the kind of reading, one of METRICS
+    seconds - how far back the readings used go
+    """
+    with _lock:
+        series = _series.get((tank.lower(), metric))
+        if not series:
+            return None
+        rows = [(period['start'], period['mean'])
+                for period in series.tiers['minute'].periods()]
+        if len(rows) < 2:
+            rows = list(series.raw.rows())
+    if len(rows) < 2:
+        return None
+    newest = rows[-1][0]
+    rows = [(t - newest, value) for t, value in rows if newest - t <= seconds]
+    count = len(rows)
+    mean_time = math.fsum(t for t, value in rows) / count
+    mean_value = math.fsum(value for t, value in rows) / count
+    spread = math.fsum((t - mean_time) ** 2 for t, value in rows)
+    if not spread:
+        return None
+    slope = math.fsum((t - mean_time) * (value - mean_value)
+                      for t, value in rows) / spread
+    return slope * 3600
+
+
+def history(tank: str, metric: str, tier: str = 'minute') -> list:
+    """
+    Returns the minimum, maximum and mean of a reading in each period
+
+    Arguments:
+    tank - the name of the container
+    metric - the kind of reading, one of METRICS
+    tier - 'minute' or 'hour'
+    """
+    with _lock:
+        series = _series.get((tank.lower(), metric))
+        return series.tiers[tier].periods() if series else []
+
+
+def summary(tank: str) -> dict:
+    """
+    Returns the current value and trend of each reading of a tank as text
+
+    Readings which have not been received are left out.
+
+    Arguments:
+    tank - the name of the container
+    """
+    text = {}
+    for metric in METRICS:
+        value = latest(tank, metric)
+        if value is None:
+            continue
+        places = PLACES[metric]
+        change = trend(tank, metric)
+        if change is None or abs(change) < STEADY[metric]:
+            direction = "steady"
+        else:
+            direction = "%s %.*f per hour" % (
+                ("falling", "rising")[change > 0], places, abs(change))
+        text[metric.capitalize()] = "%.*f, %s" % (places, value, direction)
+    return text
+
+
+def parse_line(line: str) -> tuple:
+    """
+    Reads a "tank,metric,value,timestamp" line of the feed
+
+    Arguments:
+    line - the line of text
+    """
+    tank, metric, value, timestamp = line.strip().split(",")
+    return tank, metric, float(value), float(timestamp)
+
+
+def follow_feed(path: str = FEED_FILE, poll: float = 0.5,
+                stop: threading.Event = None) -> None:
+    """
+    Reads readings from the feed file as they are written
+
+    The file is read from its end, and is read from the start again if
+    it becomes smaller (i.e. it was started again). Lines which can not
+    be read are skipped.
+
+    Arguments:
+    path - the path of the feed file
+    poll - the number of seconds to wait when there are no new readings
+    stop - event which stops the reading when set (runs forever if omitted)
+    """
+    stop = stop or threading.Event()
+    offset = os.path.getsize(path) if os.path.exists(path) else 0
+    partial = ""
+    while not stop.is_set():
+        if not os.path.exists(path) or os.path.getsize(path) < offset:
+            offset = 0  # feed started again
+            partial = ""
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                f.seek(offset)
+                text = f.read()
+                offset = f.tell()
+            lines = (partial + text).split("\n")
+            partial = lines.pop()  # line still being written
+            for line in lines:
+                try:
+                    record(*parse_line(line))
+                except ValueError:
+                    pass
+        stop.wait(poll)
+
+
+def start_feed(path: str = FEED_FILE) -> threading.Event:
+    """
+    Reads the feed file in a background thread
+
+    The returned event stops the thread when it is set.
+
+    Arguments:
+    path - the path of the feed file
+    """
+    stop = threading.Event()
+    threading.Thread(target=follow_feed, args=(path, 0.5, stop),
+                     daemon=True).start()
+    return stop
+
+
+def simulate(tanks: list, rate: float = 1.0, start: float = None,
+             seed: int = None) -> Iterator[tuple]:
+    """
+    Yields simulated readings from fermenting tanks, without end
+
+    Each tank starts at a random temperature and original gravity. The
+    temperature wanders around its starting point and the gravity
+    falls slowly as the beer ferments.
+
+    Arguments:
+    tanks - the names of the tanks to simulate
+    rate - the number of readings per second from each tank
+    start - the time of the first reading in seconds (now if omitted)
+    seed - seed for the random numbers, to repeat the same readings
+    """
+    generator = random.Random(seed)
+    timestamp = time.time() if start is None else start
+    state = {}
+    for tank in tanks:
+        setpoint = generator.uniform(8.0, 14.0)
+        state[tank] = {'setpoint': setpoint, 'temperature': setpoint,
+                       'gravity': generator.uniform(1.045, 1.055)}
+    step = 1.0 / rate
+    while True:
+        for tank in tanks:
+            readings = state[tank]
+            readings['temperature'] += (
+                0.01 * (readings['setpoint'] - readings['temperature'])
+                + generator.gauss(0, 0.02))  # pulled back to the setpoint
+            readings['gravity'] = max(
+                readings['gravity'] - generator.uniform(0, 2e-7) * step, 1.005)
+            for metric in METRICS:
+                yield tank, metric, readings[metric], timestamp
+        timestamp += step
+
+
+def write_feed(readings: Iterator[tuple], path: str = FEED_FILE,
+               realtime: bool = True) -> None:
+    """
+    Appends readings to the feed file
+
+    The file is emptied once it reaches FEED_MAX_BYTES, so it does not
+    grow without end.
+
+    Arguments:
+    readings - iterator of (tank, metric, value, timestamp) tuples
+    path - the path of the feed file
+    realtime - wait until each reading's timestamp before writing it
+    """
+    for tank, metric, value, timestamp in readings:
+        if realtime and timestamp > time.time():
+            time.sleep(timestamp - time.time())
+        mode = 'a'
+        if os.path.exists(path) and os.path.getsize(path) >= FEED_MAX_BYTES:
+            mode = 'w'
+        with open(path, mode) as f:
+            f.write("%s,%s,%.5f,%.3f\n" % (tank, metric, value, timestamp))
+
+
+if __name__ == "__main__":
+    import itertools
+    import brewery
+    parser = argparse.ArgumentParser(description="Tank telemetry")
+    parser.add_argument('command', choices=('simulate', 'summary'))
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help="readings per second from each tank")
+    parser.add_argument('--seconds', type=float,
+                        help="length of the simulation (runs until stopped "
+                             "if omitted)")
+    parser.add_argument('--seed', type=int)
+    options = parser.parse_args()
+    if options.command == 'summary' and not options.seconds:
+        options.seconds = TREND_SECONDS
+    tanks = list(brewery.read_data('containers'))
+    readings = simulate(tanks, options.rate, seed=options.seed)
+    if options.seconds:
+        count = int(options.seconds * options.rate) * len(tanks) * len(METRICS)
+        readings = itertools.islice(readings, count)
+    if options.command == 'simulate':
+        write_feed(readings)
+    else:  # readings added straight away and summarised
+        ingest(readings)
+        for tank in tanks:
+            print(tank, summary(tank))